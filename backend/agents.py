@@ -0,0 +1,75 @@
+# AI agents for headless play (tournaments, benchmarks). each agent plays a whole turn for the side to move.
+from random_ai import random_turn
+import neural_ai
+import rollout_ai
+import search_ai
+
+
+class RandomAgent:
+    """Plays a uniformly random legal checker move until the turn ends, like Rplay_ai_move."""
+
+    name = "random"
+
+    def play_turn(self, game):
+        random_turn(game)
+
+
+class RolloutAgent:
+    """Plays the full play with the best Monte Carlo rollout equity, see rollout_ai.choose_play."""
+
+    name = "rollout"
+
+    def __init__(self, budget=0.2, workers=0):
+        self.budget = budget
+        self.workers = workers
+
+    def play_turn(self, game):
+        moves, _ = rollout_ai.choose_play(game, self.budget, self.workers)
+        for start, end, _, _ in moves:
+            game.make_move(start, end)
+
+
+class SearchAgent:
+    """Plays the best play found by expectiminimax search, see search_ai.ExpectiminimaxSearch."""
+
+    name = "expectiminimax"
+
+    def __init__(self, time_limit=0.5, max_depth=2):
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.searcher = search_ai.ExpectiminimaxSearch()
+
+    def play_turn(self, game):
+        moves, _ = search_ai.choose_play(game, self.time_limit, self.max_depth, self.searcher)
+        for start, end, _, _ in moves:
+            game.make_move(start, end)
+
+
+class NeuralAgent:
+    """Plays the play the neural network rates best, see neural_ai.choose_play."""
+
+    name = "neural"
+
+    def __init__(self, path=neural_ai.DEFAULT_PATH):
+        self.net = neural_ai.Network.load(path)
+
+    def play_turn(self, game):
+        moves, _ = neural_ai.choose_play(game, self.net)
+        for start, end, _, _ in moves:
+            game.make_move(start, end)
+
+
+# Agents available by name, e.g. on the tournament command line.
+AGENTS = {
+    "random": RandomAgent,
+    "rollout": RolloutAgent,
+    "expectiminimax": SearchAgent,
+    "neural": NeuralAgent,
+}
+
+
+def make_agent(name):
+    """Creates a new agent by name. Raises ValueError for unknown names."""
+    if name not in AGENTS:
+        raise ValueError("Unknown agent %r, expected one of: %s" % (name, ", ".join(sorted(AGENTS))))
+    return AGENTS[name]()
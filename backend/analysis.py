@@ -0,0 +1,280 @@
+# bulk position analysis. replays archived games, rates every played turn against the best legal
+# play on a process pool and streams one result line per turn, so archives of any size run in
+# constant memory and an interrupted run picks up where it stopped.
+# usage: python analysis.py games.jsonl analysis.jsonl --workers 4
+#        python analysis.py database.db analysis.jsonl
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from game import Backgammon
+from models import MOVE, RESIGN, ROLL, TURN, read_archive
+from position import Position, legal_plays
+
+# Equity lost by a play (in the [-1, 1] scale) from which it counts as an error, and a blunder.
+ERROR = 0.04
+BLUNDER = 0.08
+
+# Per-side totals kept across a run (and in its checkpoint).
+TOTALS = ("turns", "rated", "errors", "blunders", "equity_lost")
+
+
+def read_games(path):
+    """
+    Streams the games of an archive as (game_id, turns), one game at a time. A turn is
+    (player, (die1, die2), [(start, end), ...]) with the checker moves played with that roll.
+
+    path is either a SQLite database written by models.GameStore (opened read-only) or a JSON
+    lines file. Each line holds a game in the simple import format
+        {"game_id": "g1", "turns": [{"player": 1, "dice": [3, 1], "moves": [[16, 19], [18, 19]]}, ...]}
+    or as the event list written by `python models.py` ({"game_id": ..., "events": [[kind, a, b], ...]}).
+    A missing file raises FileNotFoundError at once, before anything is read.
+    """
+    if path.endswith((".db", ".sqlite", ".sqlite3")):
+        return ((game_id, events_to_turns(events)) for game_id, events in read_archive(path))
+    return _read_lines(open(path))
+
+
+def _read_lines(f):
+    with f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if "events" in record:
+                yield record["game_id"], events_to_turns(record["events"])
+            else:
+                yield record["game_id"], [(t["player"], tuple(t["dice"]), [tuple(m) for m in t["moves"]])
+                                          for t in record["turns"]]
+
+
+def events_to_turns(events):
+    """Turns (see read_games) of a recorded event list; rolls nothing was played with are left out."""
+    turns = []
+    player = 1
+    turn = None
+    for kind, a, b in events:
+        if kind == TURN:
+            player = a
+            turn = None
+        elif kind == ROLL:
+            turn = (player, (a, b), [])
+            turns.append(turn)
+        elif kind == MOVE and turn is not None:
+            turn[2].append((a, b))
+        elif kind == RESIGN:
+            break
+    return [t for t in turns if t[2]]
+
+
+def replay(game_id, turns):
+    """
+    Rebuilds the positions of a game with Backgammon.make_move. Yields one task per turn:
+    (game_id, turn number, player, dice, Position.key() before the turn, points and off counts after
+    it, moves). Stops at the first move the game does not accept.
+    """
+    game = Backgammon()
+    for number, (player, dice, moves) in enumerate(turns):
+        if game.game_over:
+            return
+        if game.current_player != player:
+            game.current_player = player
+        d1, d2 = dice
+        # Set the roll the way models.apply_event replays a recorded one.
+        game.dice = (d1, d2)
+        game.moves_remaining = [d1] * 4 if d1 == d2 else [d1, d2]
+        game.version += 1
+        before = game.pos.key()
+        for start, end in moves:
+            if not game.make_move(start, end):
+                return
+            if game.current_player != player:
+                break
+        # make_move() may already have passed the turn, but the checkers are where the play left them.
+        after = game.pos.key()[:28]
+        yield game_id, number, player, (d1, d2), before, after, moves
+
+
+_network = None
+
+
+def _evaluator(name):
+    """Function rating a list of positions (the side that just played still to move) for that side."""
+    global _network
+    if name == "neural":
+        import neural_ai
+
+        if _network is None:
+            _network = neural_ai.default_network()
+        if _network is not None:
+            return lambda side, children: [2.0 * float(v) - 1.0 for v in
+                                           _network.forward(neural_ai.encode_positions(children, side))]
+    from search_ai import heuristic_eval
+
+    def heuristic(side, children):
+        values = []
+        for child in children:
+            child.switch_turn()
+            values.append(-heuristic_eval(child))
+            child.switch_turn()
+        return values
+    return heuristic
+
+
+def analyse_chunk(tasks, evaluator="neural"):
+    """
+    Worker task: rates the played move of every replay() task against all legal plays.
+    Returns one result dict per task; equity_loss is None when the moves are not a full legal play.
+    """
+    rate = _evaluator(evaluator)
+    results = []
+    for game_id, number, player, dice, before, after, moves in tasks:
+        pos = Position.from_key(before)
+        d1, d2 = dice
+        plays = legal_plays(pos, [d1] * 4 if d1 == d2 else [d1, d2])
+        values = rate(player, [child for _, child in plays])
+        best = max(range(len(plays)), key=values.__getitem__)
+        played = next((i for i, (_, child) in enumerate(plays) if tuple(child.key()[:28]) == after), None)
+        result = {
+            "game_id": game_id,
+            "turn": number,
+            "player": player,
+            "dice": [d1, d2],
+            "position_id": pos.position_id(),
+            "moves": [list(m) for m in moves],
+            "plays": len(plays),
+            "best": [[s, e] for s, e, _, _ in plays[best][0]],
+            "equity_loss": None,
+        }
+        if played is not None:
+            loss = max(0.0, values[best] - values[played])
+            result["equity_loss"] = round(loss, 5)
+            result["error"] = "blunder" if loss >= BLUNDER else "error" if loss >= ERROR else None
+        results.append(result)
+    return results
+
+
+def _chunks(games, chunk_size):
+    """Groups the replay() tasks of whole games into lists of about chunk_size tasks: (games, tasks)."""
+    count, tasks = 0, []
+    for game_id, turns in games:
+        tasks.extend(replay(game_id, turns))
+        count += 1
+        if len(tasks) >= chunk_size:
+            yield count, tasks
+            count, tasks = 0, []
+    if count:
+        yield count, tasks
+
+
+def _load_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_checkpoint(path, checkpoint):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp, path)
+
+
+def analyse(source, out, workers=0, chunk_size=256, evaluator="neural", fresh=False, progress=None):
+    """
+    Analyses every game of the archive source (see read_games) and appends the results to out,
+    one JSON line per turn. At most 2 * workers chunks are in flight, so memory does not grow
+    with the archive.
+
+    After each chunk is written, out + ".checkpoint" records how many games and output bytes are
+    done. A later run with the same arguments skips those games and cuts out back to that size,
+    so nothing is lost or written twice. fresh ignores an existing checkpoint. Returns the
+    per-side totals ({"1": {...}, "-1": {...}}).
+    """
+    checkpoint_path = out + ".checkpoint"
+    checkpoint = None if fresh else _load_checkpoint(checkpoint_path)
+    if checkpoint is None:
+        checkpoint = {"source": source, "games": 0, "bytes": 0,
+                      "totals": {str(side): dict.fromkeys(TOTALS, 0) for side in (1, -1)}}
+    elif checkpoint["source"] != source:
+        raise ValueError("%s belongs to a run over %s" % (checkpoint_path, checkpoint["source"]))
+
+    games = read_games(source)
+    for _ in range(checkpoint["games"]):
+        next(games, None)
+
+    pool = ProcessPoolExecutor(workers) if workers else None
+    pending = deque()
+    with open(out, "a+b") as f:
+        f.truncate(checkpoint["bytes"])
+        f.seek(checkpoint["bytes"])
+
+        def write(count, results):
+            for result in results:
+                f.write((json.dumps(result) + "\n").encode())
+                totals = checkpoint["totals"][str(result["player"])]
+                totals["turns"] += 1
+                if result["equity_loss"] is not None:
+                    totals["rated"] += 1
+                    totals["equity_lost"] += result["equity_loss"]
+                    totals["errors"] += result["error"] is not None
+                    totals["blunders"] += result["error"] == "blunder"
+            f.flush()
+            os.fsync(f.fileno())
+            checkpoint["games"] += count
+            checkpoint["bytes"] = f.tell()
+            _save_checkpoint(checkpoint_path, checkpoint)
+            if progress:
+                progress(checkpoint)
+
+        try:
+            for count, tasks in _chunks(games, chunk_size):
+                if pool is None:
+                    write(count, analyse_chunk(tasks, evaluator))
+                    continue
+                pending.append((count, pool.submit(analyse_chunk, tasks, evaluator)))
+                # Results are written in archive order, so the checkpoint is a plain game count.
+                while len(pending) >= 2 * workers:
+                    count, future = pending.popleft()
+                    write(count, future.result())
+            while pending:
+                count, future = pending.popleft()
+                write(count, future.result())
+        finally:
+            if pool:
+                pool.shutdown(cancel_futures=True)
+    return checkpoint["totals"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rate every played turn of a game archive.")
+    parser.add_argument("source", help="JSON lines archive or SQLite game database")
+    parser.add_argument("out", help="JSON lines output, one result per turn")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes (0 analyses in this process)")
+    parser.add_argument("--chunk", type=int, default=256, help="turns per worker task")
+    parser.add_argument("--evaluator", choices=("neural", "heuristic"), default="neural")
+    parser.add_argument("--fresh", action="store_true", help="start over instead of resuming")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+
+    def progress(checkpoint):
+        print("%d games" % checkpoint["games"], file=sys.stderr)
+
+    totals = analyse(args.source, args.out, args.workers, args.chunk, args.evaluator, args.fresh, progress)
+    print("done in %.1fs" % (time.perf_counter() - t0))
+    for side, name in (("1", "White"), ("-1", "Black")):
+        t = totals[side]
+        rated = t["rated"] or 1
+        print("%s: %d turns, %d rated, error rate %.3f, blunder rate %.3f, mean equity lost %.4f"
+              % (name, t["turns"], t["rated"], t["errors"] / rated, t["blunders"] / rated,
+                 t["equity_lost"] / rated))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,14 +3,21 @@ from flask import Flask
 from flask_cors import CORS
 from flask_socketio import SocketIO
 
+import config
+from telemetry import configure_logging
+
+configure_logging(config.LOG_LEVEL)
+
 # Initialize Flask app
 app = Flask(__name__)
 CORS(app)
 socketio = SocketIO(app, cors_allowed_origins="*")
 
 # Import and register Blueprints **after** initializing app
-from routes import game_routes
+from routes import game_routes, find_session
 app.register_blueprint(game_routes)
+import sockets
+sockets.init_socketio(socketio, find_session)
 
 @app.route('/')
 def home():
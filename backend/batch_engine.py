@@ -0,0 +1,336 @@
+# batched game engine. plays thousands of games at once with numpy array operations,
+# for policy evaluation and training-data generation.
+import argparse
+import random
+import time
+
+import numpy as np
+
+from game import Backgammon
+from position import Position
+
+# Legal moves are kept as bitboards: a (N, 6) uint32 array where bit s of column d - 1 is set when
+# the checker on slot s can move with die d. Slots are seen from the side to move, which always
+# moves towards higher slots:
+#   0      -> own bar
+#   1..24  -> points, own home board is 19..24
+# A (slot, die) pair identifies one move: slot + die <= 24 is a normal move (or re-entry from
+# slot 0), anything past 24 is a bear-off.
+SLOTS = 25
+DICE = 6
+HOME = 19  # First slot of the home board.
+LOW_SLOTS = np.uint32((1 << HOME) - 1)  # Bits of every slot outside the home board, bar included.
+DIE_VALUES = np.arange(7)
+
+
+class BatchBackgammon:
+    """
+    N independent games held as arrays:
+        points     (N, 26) int8   Position.points layout (bars in slots 0 and 25)
+        off        (N, 2)  int8   borne-off counts, [white, black]
+        turn       (N,)    int8   1 for white, -1 for black
+        dice       (N, 2)  int8   last roll
+        remaining  (N, 4)  int8   dice left to play this turn, 0 where used
+        winner     (N,)    int8   0 while playing, then 1 or -1 (same rule as Backgammon.check_game_over);
+                                  run() marks slots it no longer needs with 2
+    """
+
+    def __init__(self, n, seed=None, turn=None):
+        self.n = n
+        self.rng = np.random.default_rng(seed)
+        self.start_turn = turn
+        self.initial = np.array(Backgammon().pos.points, dtype=np.int8)
+        self.points = np.empty((n, 26), dtype=np.int8)
+        self.off = np.empty((n, 2), dtype=np.int8)
+        self.turn = np.empty(n, dtype=np.int8)
+        self.dice = np.zeros((n, 2), dtype=np.int8)
+        self.remaining = np.zeros((n, 4), dtype=np.int8)
+        self.winner = np.empty(n, dtype=np.int8)
+        self.moves_played = np.empty(n, dtype=np.int32)
+        self.reset(np.arange(n))
+
+    def reset(self, idx):
+        """Starts new games in the slots idx: opening position, starting side, first roll."""
+        self.points[idx] = self.initial
+        self.off[idx] = 0
+        if self.start_turn is None:
+            self.turn[idx] = self.rng.choice(np.array([1, -1], dtype=np.int8), size=len(idx))
+        else:
+            self.turn[idx] = self.start_turn
+        self.winner[idx] = 0
+        self.moves_played[idx] = 0
+        self.roll_dice(idx)
+
+    def roll_dice(self, idx):
+        """Rolls new dice for the games in idx and refills their remaining moves."""
+        dice = self.rng.integers(1, 7, size=(len(idx), 2), dtype=np.int8)
+        self.dice[idx] = dice
+        doubles = dice[:, 0] == dice[:, 1]
+        remaining = np.zeros((len(idx), 4), dtype=np.int8)
+        remaining[:, :2] = dice
+        remaining[doubles, 2:] = dice[doubles, :1]
+        self.remaining[idx] = remaining
+
+    def perspective(self, idx):
+        """The boards of games idx seen by the side to move: own checkers positive, moving towards slot 24."""
+        points = self.points[idx]
+        white = self.turn[idx] == 1
+        points[~white] = -points[~white, ::-1]
+        return points
+
+    def legal_move_bits(self, idx):
+        """Returns the (len(idx), 6) uint32 legal move bitboards for games idx (see the module comment)."""
+        n = len(idx)
+        rows = np.arange(n)
+        p = self.perspective(idx)[:, :SLOTS]
+        remaining = self.remaining[idx]
+
+        available = np.zeros((n, 7), dtype=bool)
+        for k in range(4):
+            available[rows, remaining[:, k]] = True
+        available[:, 0] = False
+
+        # Bit s set: own checker on slot s / slot s open to land on. Bits past slot 24 stay clear,
+        # so moves running off the end of the board are never normal moves.
+        own = _pack(p > 0)
+        open_points = _pack(p >= -1)
+        # Checkers on the bar must re-enter before anything else moves.
+        movable = np.where(own & 1, np.uint32(1), own)
+        bits = np.empty((n, DICE), dtype=np.uint32)
+        for d in range(1, 7):
+            bits[:, d - 1] = movable & (open_points >> np.uint32(d))
+        bits *= available[:, 1:]
+
+        # Bearing off, once every own checker is in the home board.
+        home = (own & LOW_SLOTS) == 0
+        for d in range(1, 7):
+            # The checker on slot 25 - d bears off exactly with d.
+            bits[:, d - 1] |= own & np.uint32(1 << (SLOTS - d)) * (home & available[:, d])
+        # The furthest checker may also bear off with the smallest die above the one required.
+        lowest = own & (~own + np.uint32(1))
+        furthest = np.bitwise_count(lowest - np.uint32(1)).astype(np.int64)
+        required = np.clip(SLOTS - furthest, 0, 6)
+        higher = available & (DIE_VALUES[None, :] > required[:, None])
+        smallest = np.where(higher, DIE_VALUES[None, :], 7).min(axis=1)
+        ok = home & (own != 0) & ~available[rows, required] & (smallest < 7)
+        bits[rows[ok], smallest[ok] - 1] |= lowest[ok]
+        return bits
+
+    def legal_moves(self, idx=None):
+        """Returns the legal moves of games idx (all games by default) as a (len(idx), 6, 25) bool mask."""
+        if idx is None:
+            idx = np.arange(self.n)
+        bits = self.legal_move_bits(idx)
+        return np.unpackbits(bits.view(np.uint8).reshape(len(idx), DICE, 4), axis=2,
+                             bitorder="little")[:, :, :SLOTS].astype(bool)
+
+    def move_tuples(self, i, moves_mask):
+        """Converts game i's legal move mask (6, 25) into get_all_available_moves() style tuples."""
+        moves = []
+        white = self.turn[i] == 1
+        for d, s in zip(*np.nonzero(moves_mask)):
+            s, d = int(s), int(d) + 1
+            if white:
+                start, end = s - 1, min(s - 1 + d, 24)
+            else:
+                start, end = 24 - s, max(24 - s - d, -1)
+            if s == 0:
+                move_type = "re-entry"
+            elif end == 24 or end == -1:
+                move_type = "bear_off"
+            else:
+                move_type = "normal"
+            moves.append((start, end, d, move_type))
+        return moves
+
+    def apply(self, idx, slots, dice):
+        """Plays one move (perspective slot, die value) in each of the games in idx."""
+        side = self.turn[idx]
+        white = side == 1
+        src = np.where(white, slots, SLOTS - slots)
+        target = slots + dice
+        off = target >= SLOTS
+        dst = np.where(white, target, SLOTS - target)
+        pts = self.points
+        pts[idx, src] -= side
+
+        self.off[idx[off & white], 0] += 1
+        self.off[idx[off & ~white], 1] += 1
+
+        on = ~off
+        i, dst, side = idx[on], dst[on], side[on]
+        hit = pts[i, dst] == -side
+        pts[i[hit], dst[hit]] = 0
+        bar = np.where(side[hit] == 1, SLOTS, 0)
+        pts[i[hit], bar] -= side[hit]
+        pts[i, dst] += side
+
+        # Use up the die.
+        col = (self.remaining[idx] == dice[:, None]).argmax(axis=1)
+        self.remaining[idx, col] = 0
+        self.moves_played[idx] += 1
+        # A turn whose dice are all used ends now rather than on the next step.
+        finished = idx[~self.remaining[idx].any(axis=1)]
+        self.turn[finished] *= -1
+        self.roll_dice(finished)
+
+        # Same rule as Backgammon.check_game_over: a side with no checkers left on the points wins.
+        # Every game starts with 15 checkers a side, so that is "all 15 are borne off or on the bar".
+        no_white = self.off[idx, 0] + pts[idx, 0] == 15
+        no_black = self.off[idx, 1] - pts[idx, SLOTS] == 15
+        self.winner[idx] = np.where(no_white, 1, np.where(no_black, -1, 0))
+
+    def step(self, policy=None):
+        """
+        Advances every unfinished game by one checker move. Games whose side to move has no
+        legal move (or no dice left) pass the turn and roll instead, like Backgammon.make_move.
+        policy(engine, idx, bits) receives the legal move bitboards of the games idx and returns
+        the chosen (slots, dice) arrays, one move per game.
+        Returns the indices of the games that were still playing.
+        """
+        active = np.nonzero(self.winner == 0)[0]
+        if not len(active):
+            return active
+        bits = self.legal_move_bits(active)
+        has_move = bits.any(axis=1)
+
+        passing = active[~has_move]
+        self.turn[passing] *= -1
+        self.roll_dice(passing)
+
+        if has_move.any():
+            playing = active[has_move]
+            slots, dice = (policy or random_policy)(self, playing, bits[has_move])
+            self.apply(playing, slots, dice)
+        return active
+
+    def play(self, policy=None, max_steps=10000):
+        """Plays every game to the end (or max_steps) and returns the winners."""
+        for _ in range(max_steps):
+            if not len(self.step(policy)):
+                break
+        return self.winner
+
+    def run(self, games, policy=None):
+        """
+        Plays `games` games in total, starting a new game in each slot as soon as its game ends,
+        so the batch stays full. Returns the winners in the order the games finished.
+        """
+        winners = []
+        started = self.n
+        while len(winners) < games:
+            self.step(policy)
+            done = np.nonzero((self.winner == 1) | (self.winner == -1))[0]
+            if not len(done):
+                continue
+            winners.extend(int(w) for w in self.winner[done])
+            restart = done[:max(0, games - started)]
+            started += len(restart)
+            self.reset(restart)
+            self.winner[done[len(restart):]] = 2  # Slot retired: keeps it out of step().
+        return np.array(winners[:games], dtype=np.int8)
+
+    def position(self, i):
+        """Game i as a Position."""
+        pos = Position(turn=int(self.turn[i]), off_white=int(self.off[i, 0]), off_black=int(self.off[i, 1]))
+        pos.points = [int(x) for x in self.points[i]]
+        pos.rehash()
+        return pos
+
+
+def _pack(mask):
+    """Packs a (n, 25) bool array into one uint32 bitboard per row, bit s for column s."""
+    return np.packbits(mask, axis=1, bitorder="little").view(np.uint32).ravel()
+
+
+def random_policy(engine, idx, bits):
+    """Picks a uniformly random legal move in every game."""
+    n = len(idx)
+    rows = np.arange(n)
+    counts = np.bitwise_count(bits).astype(np.int64)
+    cumulative = counts.cumsum(axis=1)
+    pick = (engine.rng.random(n) * cumulative[:, -1]).astype(np.int64)
+    die = (cumulative > pick[:, None]).argmax(axis=1)
+    # Index of the chosen move among the set bits of that die, then drop lower set bits.
+    rank = pick - (cumulative[rows, die] - counts[rows, die])
+    chosen = bits[rows, die]
+    for _ in range(int(rank.max())):
+        chosen = np.where(rank > 0, chosen & (chosen - np.uint32(1)), chosen)
+        rank -= 1
+    slots = np.bitwise_count((chosen & (~chosen + np.uint32(1))) - np.uint32(1)).astype(np.int64)
+    return slots, die + 1
+
+
+def cross_check(n=64, seed=0, max_steps=3000):
+    """
+    Plays a batch and compares every game's legal move set with Backgammon.get_all_available_moves()
+    at every step. Returns the number of positions compared; raises AssertionError on a mismatch.
+    """
+    engine = BatchBackgammon(n, seed=seed)
+    compared = 0
+    for _ in range(max_steps):
+        if not (engine.winner == 0).any():
+            break
+        active = np.nonzero(engine.winner == 0)[0]
+        mask = engine.legal_moves(active)
+        for row, i in enumerate(active):
+            g = Backgammon()
+            g.pos = engine.position(i)
+            g.moves_remaining = [int(d) for d in engine.remaining[i] if d]
+            expected = set(g.get_all_available_moves())
+            got = set(engine.move_tuples(i, mask[row]))
+            assert got == expected, (g.pos.points, g.moves_remaining, sorted(got ^ expected))
+            compared += 1
+        engine.step()
+    return compared
+
+
+def sequential_games(games, seed=0):
+    """Baseline: random games one at a time through Backgammon, as Rplay_ai_move plays them."""
+    random.seed(seed)
+    for _ in range(games):
+        g = Backgammon()
+        g.current_player = random.choice([1, -1])
+        g.roll_dice()
+        for _ in range(10000):
+            if g.game_over:
+                break
+            moves = g.get_all_available_moves()
+            if not moves:
+                g.current_player *= -1
+                g.roll_dice()
+                continue
+            start, end, _, _ = random.choice(moves)
+            g.make_move(start, end)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched random self-play throughput and cross-check.")
+    parser.add_argument("--games", type=int, default=20000, help="games to play")
+    parser.add_argument("--batch", type=int, default=10000, help="games played side by side")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--check", action="store_true", help="cross-check move sets against Backgammon")
+    args = parser.parse_args()
+
+    if args.check:
+        print("cross-check: %d positions match get_all_available_moves" % cross_check(seed=args.seed))
+
+    t0 = time.perf_counter()
+    engine = BatchBackgammon(min(args.batch, args.games), seed=args.seed)
+    winners = engine.run(args.games)
+    batched = time.perf_counter() - t0
+    finished = len(winners)
+    print("batched:    %d games in %.2fs (%.0f games/s), white won %d"
+          % (finished, batched, finished / batched, int((winners == 1).sum())))
+
+    baseline_games = max(1, args.games // 20)
+    t0 = time.perf_counter()
+    sequential_games(baseline_games, seed=args.seed)
+    sequential = time.perf_counter() - t0
+    print("sequential: %d games in %.2fs (%.0f games/s)"
+          % (baseline_games, sequential, baseline_games / sequential))
+    print("speedup: %.1fx" % ((finished / batched) / (baseline_games / sequential)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+# one-sided bear-off database. for every home-board position of up to 15 checkers it stores the
+# expected number of rolls to bear off and the distribution of that number.
+# bearoff.bin (3.7 MB) ships with the code; rebuild it with: python bearoff.py build [path]
+# (about 5 minutes). The rollout AI (pip_equity) and the expectiminimax evaluation
+# (heuristic_eval) use it to value races, and the neural AI plays pure bear-off races from it
+# (best_race_play). Without the file everything still works, with races estimated from pips.
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+from math import comb
+
+from datafiles import DataFile
+from position import ROLLS, WHITE, Position, legal_plays
+
+POINTS = 6
+CHECKERS = 15
+POSITIONS = comb(CHECKERS + POINTS, POINTS)  # 54,264
+# Distribution buckets: P(exactly k rolls) for k < MAX_ROLLS - 1, the last bucket holds the tail.
+MAX_ROLLS = 32
+
+MAGIC = b"BGBO"
+HEADER = struct.Struct("<4sHHII")  # magic, version, points, positions, max rolls
+RECORD = struct.Struct("<f%dH" % MAX_ROLLS)  # expected rolls, distribution scaled to 0..65535
+VERSION = 1
+SCALE = 65535
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bearoff.bin")
+
+# BINOMIAL[n][k] = C(n, k), enough for ranking.
+BINOMIAL = [[comb(n, k) for k in range(POINTS + 1)] for n in range(CHECKERS + POINTS + 1)]
+
+
+def rank(counts):
+    """
+    Index of a one-sided position, counts[i] = checkers on the point i + 1 pips from off.
+
+    A position is a split of 15 checkers into the 6 points plus "borne off", i.e. a choice of 6
+    separator places among 21; the rank is that combination in the combinatorial number system.
+    """
+    r = 0
+    place = CHECKERS - sum(counts)  # Borne-off checkers come first.
+    for i, c in enumerate(counts):
+        r += BINOMIAL[place + i][i + 1]
+        place += c
+    return r
+
+
+def unrank(r):
+    """Inverse of rank()."""
+    places = []
+    for k in range(POINTS, 0, -1):
+        n = k - 1
+        while BINOMIAL[n + 1][k] <= r:
+            n += 1
+        places.append(n)
+        r -= BINOMIAL[n][k]
+    places.reverse()
+    counts = [places[i] - places[i - 1] - 1 for i in range(1, POINTS)]
+    counts.append(CHECKERS + POINTS - 1 - places[-1])
+    return tuple(counts)
+
+
+def home_counts(pos, side):
+    """One-sided counts of side's home board, or None if any of its checkers are outside it."""
+    p = pos.points
+    if side == WHITE:
+        if p[0] > 0 or any(p[slot] > 0 for slot in range(1, 19)):
+            return None
+        return tuple(max(p[25 - d], 0) for d in range(1, POINTS + 1))
+    if p[25] < 0 or any(p[slot] < 0 for slot in range(7, 25)):
+        return None
+    return tuple(max(-p[d], 0) for d in range(1, POINTS + 1))
+
+
+def _build_records(progress=None):
+    """Computes (expected rolls, distribution) for every rank with the engine's own bear-off rules."""
+    positions = sorted((unrank(r) for r in range(POSITIONS)),
+                       key=lambda c: sum((i + 1) * n for i, n in enumerate(c)))
+    expected = [0.0] * POSITIONS
+    distribution = [None] * POSITIONS
+    empty = [0.0] * MAX_ROLLS
+    empty[0] = 1.0
+    distribution[rank((0,) * POINTS)] = empty
+
+    for done, counts in enumerate(positions):
+        r = rank(counts)
+        if distribution[r] is not None:
+            continue
+        # White bearing off, no black checkers left to get in the way.
+        board = [0] * 24
+        for d, n in enumerate(counts, start=1):
+            board[24 - d] = n
+        pos = Position(board, off_white=CHECKERS - sum(counts), off_black=CHECKERS, turn=WHITE)
+        mean = 1.0
+        dist = [0.0] * MAX_ROLLS
+        for dice, p in ROLLS:
+            best = None
+            for _, child in legal_plays(pos, dice):
+                child_rank = rank(home_counts(child, WHITE))
+                if best is None or expected[child_rank] < expected[best]:
+                    best = child_rank
+            mean += p * expected[best]
+            child_dist = distribution[best]
+            for k in range(MAX_ROLLS - 1):
+                dist[k + 1] += p * child_dist[k]
+            dist[MAX_ROLLS - 1] += p * child_dist[MAX_ROLLS - 1]
+        expected[r] = mean
+        distribution[r] = dist
+        if progress and done % 5000 == 0:
+            progress(done)
+    return expected, distribution
+
+
+def build(path=DEFAULT_PATH, progress=None):
+    """Computes the database and writes it to path (about 3.6 MB)."""
+    expected, distribution = _build_records(progress)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, POINTS, POSITIONS, MAX_ROLLS))
+        for r in range(POSITIONS):
+            scaled = [min(SCALE, round(x * SCALE)) for x in distribution[r]]
+            f.write(RECORD.pack(expected[r], *scaled))
+    os.replace(tmp, path)
+
+
+class BearoffDatabase:
+    """
+    Read-only view of a database file. The file is memory-mapped, so lookups only touch the pages
+    they need and every process that opens it shares the same page cache.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, points, positions, max_rolls = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION or points != POINTS or positions != POSITIONS \
+                or max_rolls != MAX_ROLLS:
+            self._map.close()
+            raise ValueError("%s is not a bear-off database of this version" % path)
+
+    def close(self):
+        self._map.close()
+
+    def _record(self, counts):
+        return RECORD.unpack_from(self._map, HEADER.size + rank(counts) * RECORD.size)
+
+    def expected_rolls(self, counts):
+        """Expected number of rolls to bear off the one-sided position counts."""
+        return self._record(counts)[0]
+
+    def distribution(self, counts):
+        """P(bearing off takes exactly k rolls) for k = 0..MAX_ROLLS - 1 (the last entry is the tail)."""
+        return [x / SCALE for x in self._record(counts)[1:]]
+
+    def race_win_probability(self, pos):
+        """
+        Chance that the side to move wins a pure bear-off race (both sides entirely in their home
+        boards), or None if pos is not one.
+        """
+        own = home_counts(pos, pos.turn)
+        opp = home_counts(pos, -pos.turn)
+        if own is None or opp is None:
+            return None
+        mine = self.distribution(own)
+        theirs = self.distribution(opp)
+        # The side to move wins if it needs k rolls and the opponent needs at least k.
+        win = 0.0
+        theirs_at_least = 1.0
+        for k in range(MAX_ROLLS):
+            win += mine[k] * theirs_at_least
+            theirs_at_least -= theirs[k]
+        return min(1.0, max(0.0, win))
+
+
+_default = DataFile(DEFAULT_PATH, BearoffDatabase, "no bear-off database at %s, races are estimated "
+                    "from pips; rebuild it with: python bearoff.py build")
+
+
+def default_database():
+    """The database at DEFAULT_PATH, opened on first use; None while it has not been built."""
+    return _default.get()
+
+
+def race_equity(pos):
+    """
+    Equity in [-1, 1] for the side to move from the default database if pos is a pure bear-off
+    race, otherwise None (also when the database has not been built).
+    """
+    db = default_database()
+    if db is None:
+        return None
+    p = db.race_win_probability(pos)
+    return None if p is None else 2.0 * p - 1.0
+
+
+def best_race_play(pos, plays):
+    """
+    For a pure bear-off race pos, the index and winning chance of the play (legal_plays() output)
+    that leaves the side to move the best race, looked up in the default database. None if the
+    database has not been built or pos is not a pure race.
+    """
+    db = default_database()
+    if db is None or db.race_win_probability(pos) is None:
+        return None
+    best, best_value = 0, -1.0
+    for i, (_, child) in enumerate(plays):
+        child = child.copy()
+        child.switch_turn()
+        value = 1.0 - db.race_win_probability(child)
+        if value > best_value:
+            best, best_value = i, value
+    return best, best_value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the one-sided bear-off database.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_parser = sub.add_parser("build")
+    build_parser.add_argument("path", nargs="?", default=DEFAULT_PATH)
+    query_parser = sub.add_parser("query")
+    query_parser.add_argument("counts", type=int, nargs=POINTS, help="checkers on the 1..6 points")
+    query_parser.add_argument("--path", default=DEFAULT_PATH)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        t0 = time.perf_counter()
+        build(args.path, progress=lambda n: print("%d / %d positions" % (n, POSITIONS), file=sys.stderr))
+        print("wrote %s in %.1fs" % (args.path, time.perf_counter() - t0))
+    else:
+        db = BearoffDatabase(args.path)
+        counts = tuple(args.counts)
+        dist = db.distribution(counts)
+        print("expected rolls: %.4f" % db.expected_rolls(counts))
+        print("distribution:", " ".join("%d:%.4f" % (k, p) for k, p in enumerate(dist) if p > 0))
+
+
+if __name__ == '__main__':
+    main()
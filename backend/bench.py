@@ -0,0 +1,296 @@
+# benchmark suite: engine microbenchmarks over a fixed position corpus, full-game throughput and an
+# in-process load test of the API. results are saved as JSON and can be compared against a baseline.
+# usage: python bench.py run --out baseline.json
+#        python bench.py run --compare baseline.json --threshold 0.10
+#        python bench.py compare baseline.json current.json
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+from game import Backgammon
+from position import Position
+from random_ai import random_turn
+from tournament import percentile
+
+CATEGORIES = ("opening", "contact", "bar", "bearoff")
+
+
+def _snapshot(game):
+    return game.pos.key(), tuple(game.dice), tuple(game.moves_remaining)
+
+
+def _restore(snapshot):
+    key, dice, remaining = snapshot
+    game = Backgammon()
+    game.pos = Position.from_key(key)
+    game.dice = dice
+    game.moves_remaining = list(remaining)
+    game.version += 1
+    return game
+
+
+def _category(game):
+    """Corpus category of a position with the side to move about to play, or None."""
+    pos = game.pos
+    side = pos.turn
+    if (pos.points[0] if side == 1 else -pos.points[25]) > 0:
+        return "bar"
+    if pos.all_in_home():
+        return "bearoff"
+    # Contact: some checker still has to pass an opposing one.
+    white = [s for s in range(1, 25) if pos.points[s] > 0]
+    black = [s for s in range(1, 25) if pos.points[s] < 0]
+    if white and black and min(white) < max(black):
+        return "contact"
+    return None
+
+
+def build_corpus(size=200, seed=1):
+    """
+    Position snapshots per category, from seeded random games: the opening position with every
+    roll, then contact, bar and bear-off positions met along the way (size of each).
+    """
+    corpus = {name: [] for name in CATEGORIES}
+    for d1 in range(1, 7):
+        for d2 in range(d1, 7):
+            for player in (1, -1):
+                game = Backgammon()
+                game.current_player = player
+                game.dice = (d1, d2)
+                game.moves_remaining = [d1] * 4 if d1 == d2 else [d1, d2]
+                corpus["opening"].append(_snapshot(game))
+    state = random.getstate()
+    random.seed(seed)
+    try:
+        while any(len(corpus[name]) < size for name in CATEGORIES[1:]):
+            game = Backgammon()
+            game.current_player = random.choice([1, -1])
+            game.roll_dice()
+            for _ in range(2000):
+                if game.game_over:
+                    break
+                name = _category(game)
+                if name and len(corpus[name]) < size:
+                    corpus[name].append(_snapshot(game))
+                random_turn(game)
+    finally:
+        random.setstate(state)
+    return corpus
+
+
+def _time_per_call(setup, call, repeat):
+    """Best (lowest) nanoseconds per call over repeat runs; setup() builds the call arguments."""
+    best = None
+    for _ in range(repeat):
+        args = setup()
+        t0 = time.perf_counter_ns()
+        for a in args:
+            call(a)
+        per_call = (time.perf_counter_ns() - t0) / len(args)
+        best = per_call if best is None else min(best, per_call)
+    return best
+
+
+def _cold(game):
+    # Drop the per-version caches so the call does the full work.
+    game.version += 1
+    return game
+
+
+def micro_benchmarks(corpus, repeat=5):
+    """ns per call of the engine entry points for every corpus category."""
+    results = {}
+    for name, snapshots in corpus.items():
+        games = [_restore(s) for s in snapshots]
+
+        def fresh_games():
+            return [_cold(g) for g in games]
+
+        def playable():
+            pairs = []
+            for s in snapshots:
+                g = _restore(s)
+                start, end, _, _ = g.get_all_available_moves()[0]
+                pairs.append((g, start, end))
+            return pairs
+
+        results["moves.%s" % name] = _time_per_call(fresh_games, Backgammon.get_all_available_moves, repeat)
+        results["make_move.%s" % name] = _time_per_call(playable, lambda p: p[0].make_move(p[1], p[2]), repeat)
+        results["all_in_home.%s" % name] = _time_per_call(fresh_games, Backgammon.all_in_home, repeat)
+        results["game_over.%s" % name] = _time_per_call(fresh_games, Backgammon.check_game_over, repeat)
+        results["board_state.%s" % name] = _time_per_call(
+            lambda: [_restore(s) for s in snapshots], Backgammon.get_board_state, repeat)
+    return {key: {"value": value, "unit": "ns/op", "better": "lower"} for key, value in results.items()}
+
+
+def game_throughput(games=100, seed=1):
+    """Seeded random-vs-random games played to the end: games and checker moves per second."""
+    state = random.getstate()
+    random.seed(seed)
+    moves = 0
+    try:
+        t0 = time.perf_counter()
+        for _ in range(games):
+            game = Backgammon()
+            game.current_player = random.choice([1, -1])
+            game.roll_dice()
+            while not game.game_over:
+                moves += random_turn(game)
+        elapsed = time.perf_counter() - t0
+    finally:
+        random.setstate(state)
+    return {
+        "games_per_second": {"value": games / elapsed, "unit": "games/s", "better": "higher"},
+        "moves_per_second": {"value": moves / elapsed, "unit": "moves/s", "better": "higher"},
+    }
+
+
+def api_load_test(games=20, seed=1):
+    """
+    Drives the Flask endpoints through the test client the way the frontend does (start, state,
+    moves, AI moves) and reports latency percentiles per endpoint, in milliseconds.
+    """
+    import config
+    config.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), "bench.db")
+    from app import app
+
+    client = app.test_client()
+    latencies = {}
+
+    def call(name, method, url, **kwargs):
+        t0 = time.perf_counter()
+        response = getattr(client, method)(url, **kwargs)
+        latencies.setdefault(name, []).append(time.perf_counter() - t0)
+        return response.get_json()
+
+    rng = random.Random(seed)
+    state = random.getstate()
+    random.seed(seed)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(games):
+                game_id = call("start", "post", "/api/game/start",
+                               json={"seed": rng.getrandbits(32)})["game_id"]
+                for _ in range(1000):
+                    board = call("state", "get", "/api/game/state", query_string={"game_id": game_id})
+                    if board["game_over"]:
+                        break
+                    if board["current_player"] == -1:
+                        call("ai_move", "post", "/api/game/ai-move", json={"game_id": game_id})
+                    elif board["all_moves"]:
+                        start, end, _, _ = rng.choice(board["all_moves"])
+                        call("move", "post", "/api/game/move",
+                             json={"game_id": game_id, "start": start, "end": end})
+    finally:
+        random.setstate(state)
+
+    results = {}
+    everything = []
+    for name, values in latencies.items():
+        everything.extend(values)
+        values.sort()
+        for q in (50, 95, 99):
+            results["api.%s.p%d" % (name, q)] = {"value": percentile(values, q) * 1000, "unit": "ms",
+                                                 "better": "lower"}
+    everything.sort()
+    for q in (50, 95, 99):
+        results["api.all.p%d" % q] = {"value": percentile(everything, q) * 1000, "unit": "ms", "better": "lower"}
+    return results
+
+
+def run(size=200, games=100, api_games=20, repeat=5, seed=1, log=print):
+    """Runs the whole suite and returns the baseline document."""
+    results = {}
+    log("building corpus...")
+    corpus = build_corpus(size, seed)
+    log("microbenchmarks...")
+    results.update(micro_benchmarks(corpus, repeat))
+    log("game throughput...")
+    results.update(game_throughput(games, seed))
+    log("API load test...")
+    results.update(api_load_test(api_games, seed))
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "seed": seed,
+            "corpus": {name: len(corpus[name]) for name in CATEGORIES},
+        },
+        "results": results,
+    }
+
+
+def compare(baseline, current, threshold=0.10):
+    """
+    Rows (name, baseline value, current value, relative change, regressed) for every metric in both
+    documents. A metric regresses when it got worse by more than threshold (0.10 = 10%).
+    """
+    rows = []
+    for name, old in sorted(baseline["results"].items()):
+        new = current["results"].get(name)
+        if new is None or not old["value"]:
+            continue
+        change = (new["value"] - old["value"]) / old["value"]
+        worse = change if old["better"] == "lower" else -change
+        rows.append((name, old["value"], new["value"], change, worse > threshold))
+    return rows
+
+
+def print_comparison(rows, threshold):
+    width = max((len(row[0]) for row in rows), default=10)
+    for name, old, new, change, regressed in rows:
+        print("%-*s %14.2f %14.2f %+8.1f%%%s" % (width, name, old, new, change * 100,
+                                                  "  REGRESSION" if regressed else ""))
+    regressions = sum(1 for row in rows if row[4])
+    print("%d metrics, %d regressed by more than %.0f%%" % (len(rows), regressions, threshold * 100))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backgammon engine and API benchmarks.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_parser = sub.add_parser("run", help="run the suite")
+    run_parser.add_argument("--out", help="write the results to this JSON file")
+    run_parser.add_argument("--compare", help="baseline JSON file to compare against")
+    run_parser.add_argument("--threshold", type=float, default=0.10)
+    run_parser.add_argument("--size", type=int, default=200, help="positions per corpus category")
+    run_parser.add_argument("--games", type=int, default=100, help="games for the throughput test")
+    run_parser.add_argument("--api-games", type=int, default=20, help="games for the API load test")
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--seed", type=int, default=1)
+    compare_parser = sub.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args()
+
+    if args.command == "run":
+        document = run(args.size, args.games, args.api_games, args.repeat, args.seed,
+                       log=lambda message: print(message, file=sys.stderr))
+        if args.out:
+            with open(args.out, "w") as f:
+                json.dump(document, f, indent=2)
+        if args.compare:
+            with open(args.compare) as f:
+                baseline = json.load(f)
+            sys.exit(1 if print_comparison(compare(baseline, document, args.threshold), args.threshold) else 0)
+        for name, result in sorted(document["results"].items()):
+            print("%-32s %14.2f %s" % (name, result["value"], result["unit"]))
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        sys.exit(1 if print_comparison(compare(baseline, current, args.threshold), args.threshold) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+# benchmark for the legal-move cache. replays seeded games through the same calls the routes make
+# and counts how often move generation actually runs, with and without the cache.
+import random
+import time
+
+import game
+from position import Position
+from random_ai import Rplay_ai_move
+
+
+def play_requests(games, seed):
+    """
+    Plays seeded games the way the frontend drives the API: White's checker moves go through
+    the /api/game/move sequence (make_move, then get_board_state for the response) and Black's
+    turns through Rplay_ai_move. make_move passes blocked turns itself, as in the routes.
+    Returns (requests, generation calls).
+    """
+    calls = [0]
+    original = Position.moves
+
+    def counting_moves(pos, dice):
+        calls[0] += 1
+        return original(pos, dice)
+
+    Position.moves = counting_moves
+    requests = 0
+    try:
+        random.seed(seed)
+        for _ in range(games):
+            g = game.Backgammon()
+            g.roll_dice()
+            for _ in range(2000):
+                if g.game_over:
+                    break
+                requests += 1
+                if g.current_player == -1:
+                    Rplay_ai_move(g)
+                    continue
+                moves = g.get_all_available_moves()
+                if not moves:
+                    break  # Both sides closed out: pass_blocked_turns() gave up.
+                start, end, _, _ = random.choice(moves)
+                if g.make_move(start, end):
+                    g.get_board_state()
+    finally:
+        Position.moves = original
+    return requests, calls[0]
+
+
+def main(games=50, seed=1):
+    results = {}
+    for cached in (False, True):
+        game.Backgammon.cache_moves = cached
+        t0 = time.perf_counter()
+        requests, calls = play_requests(games, seed)
+        elapsed = time.perf_counter() - t0
+        results[cached] = (requests, calls, elapsed)
+        label = "cached" if cached else "uncached"
+        print(f"{label:>9}: {requests} requests, {calls} generation calls "
+              f"({calls / requests:.2f} per request), {elapsed:.2f}s")
+    game.Backgammon.cache_moves = True
+    before, after = results[False][1], results[True][1]
+    print(f"generation calls removed: {before - after} ({100 * (before - after) / before:.1f}%)")
+
+
+if __name__ == '__main__':
+    main()
@@ -1 +1,42 @@
 # configuration settings stored sected key for securrity and database connection
+import os
+
+# Worker processes for interactive AI moves: all cores but one, none with two cores or fewer.
+_CORES = os.cpu_count() or 1
+_AI_WORKERS = _CORES - 1 if _CORES > 2 else 0
+
+# Player behind /api/game/ai-move: "neural" (needs a trained neural_weights.npz, falls back to
+# rollouts without one) or "rollout".
+AI_PLAYER = "neural"
+# Thinking time (seconds) for /api/game/ai-move.
+AI_MOVE_BUDGET = 0.2
+# Rollout worker processes for the AI move endpoint (0 runs rollouts in the request thread).
+AI_ROLLOUT_WORKERS = _AI_WORKERS
+# Worker processes computing /api/game/ai-move/jobs, and how many jobs may be queued or running.
+AI_JOB_WORKERS = max(1, _AI_WORKERS)
+AI_JOB_QUEUE_LIMIT = 64
+# Longest thinking time (seconds) a job may ask for.
+AI_JOB_MAX_BUDGET = 5.0
+# Answer positions found in opening_book.bin from the book, before any search.
+USE_OPENING_BOOK = True
+# Live games one backend process keeps; starting another evicts the least recently used.
+MAX_LIVE_GAMES = 10000
+# Seconds a game may sit idle before it is evicted.
+GAME_TTL = 3600
+
+# SQLite file games are stored in (see models.py); set PERSIST_GAMES = False to keep games in memory only.
+DATABASE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "database.db")
+PERSIST_GAMES = True
+# Stored events are committed in batches of up to STORE_BATCH, at most STORE_INTERVAL seconds late.
+STORE_BATCH = 256
+STORE_INTERVAL = 0.5
+# Events between stored snapshots; loading a game replays at most this many events.
+SNAPSHOT_EVERY = 32
+
+# Log level of the JSON log lines written to stderr (DEBUG logs every move and roll).
+LOG_LEVEL = os.environ.get("BACKGAMMON_LOG_LEVEL", "WARNING")
+# With profiling enabled, a request with ?profile=1 is sampled every PROFILE_INTERVAL seconds and
+# its stacks are written to PROFILE_DIR in collapsed-stack (flame graph) format.
+PROFILING_ENABLED = False
+PROFILE_INTERVAL = 0.001
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles")
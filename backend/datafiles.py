@@ -0,0 +1,36 @@
+# data files the AI loads on first use: the bear-off database, the opening book and the network
+# weights. each is optional; while one is missing the AI works without it, and it is looked for
+# again every RECHECK seconds so a file built or trained while the server runs is picked up.
+import logging
+import os
+import time
+
+# Seconds between looks for a missing data file.
+RECHECK = 60.0
+
+log = logging.getLogger(__name__)
+
+
+class DataFile:
+    """
+    The object load(path) makes from the file at path, loaded by the first get() that finds the
+    file. While it is missing get() returns None, logs missing (formatted with the path) once and
+    looks again at most every RECHECK seconds.
+    """
+
+    def __init__(self, path, load, missing):
+        self.path = path
+        self.load = load
+        self.missing = missing
+        self._value = None
+        self._next_check = None
+
+    def get(self):
+        if self._value is None and (self._next_check is None or time.monotonic() >= self._next_check):
+            if os.path.exists(self.path):
+                self._value = self.load(self.path)
+            else:
+                if self._next_check is None:
+                    log.warning(self.missing, self.path)
+                self._next_check = time.monotonic() + RECHECK
+        return self._value
@@ -0,0 +1,55 @@
+# dice sources. games and rollouts take their rolls from one of these, so a simulation can be
+# reproduced from a seed, scripted in a test, or share its random numbers with another one.
+import random
+from collections import deque
+
+# The 36 equally likely ordered rolls.
+ALL_ROLLS = [(d1, d2) for d1 in range(1, 7) for d2 in range(1, 7)]
+
+
+class GlobalDice:
+    """Rolls from the global random module, so random.seed() repeats them. The default source."""
+
+    def roll(self):
+        return random.randint(1, 6), random.randint(1, 6)
+
+
+class RandomDice:
+    """Fair rolls from a private random.Random seeded with seed (None seeds from the OS)."""
+
+    def __init__(self, seed=None):
+        self.seed = seed
+        self.rng = random.Random(seed)
+
+    def roll(self):
+        return self.rng.randint(1, 6), self.rng.randint(1, 6)
+
+
+class ScriptedDice:
+    """
+    Plays back rolls ((die1, die2) pairs) in order, then continues with the source then.
+    Without then, rolling past the script raises ValueError.
+    """
+
+    def __init__(self, rolls, then=None):
+        self.rolls = deque(tuple(r) for r in rolls)
+        self.then = then
+
+    def roll(self):
+        if self.rolls:
+            return self.rolls.popleft()
+        if self.then is None:
+            raise ValueError("Scripted dice ran out of rolls")
+        return self.then.roll()
+
+
+def stratified_rolls(count, start=0, order=ALL_ROLLS):
+    """
+    count rolls that cover the 36 rolls evenly: entries start .. start + count - 1 of a cycle through
+    order (a permutation of ALL_ROLLS). Used as the first rolls of a set of rollouts, so every roll
+    is played equally often instead of by chance.
+    """
+    return [order[(start + i) % len(order)] for i in range(count)]
+
+
+GLOBAL_DICE = GlobalDice()
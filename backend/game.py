@@ -1,16 +1,129 @@
-import random
+from dice import GLOBAL_DICE
+from position import Position, WHITE_BAR, BLACK_BAR, legal_plays
+from telemetry import MOVEGEN_CALLS
+
+
+class BoardView(list):
+    """
+    What Backgammon.board returns: the 24 points as a list, read when board was read. Item and
+    slice assignment (game.board[i] = n, game.board[i] -= 1) write the assigned points through to
+    the game, so code written against the old plain-list attribute keeps working; a slice
+    assignment may not change the number of points. Other list methods only change the view.
+    """
+    __slots__ = ("_game",)
+
+    def __init__(self, game):
+        super().__init__(game.pos.points[1:25])
+        self._game = game
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            indices = range(24)[index]
+            values = list(value)
+            if len(values) != len(indices):
+                raise ValueError("board slice assignment must keep the number of points")
+            super().__setitem__(index, values)
+        else:
+            indices = [range(24)[index]]
+            values = [value]
+            super().__setitem__(index, value)
+        pos = self._game.pos
+        for i, count in zip(indices, values):
+            pos.points[i + 1] = count
+        pos.rehash()
+        self._game.version += 1
+
 
 class Backgammon:
-    def __init__(self):
-        self.board = self.initialize_board()
+    # Set to False to regenerate moves on every query (used by bench_move_cache.py for comparison).
+    cache_moves = True
+    # Optional event sink (models.GameRecorder) told about every roll, turn change and move
+    # before it is applied, so the game can be persisted and replayed.
+    recorder = None
+
+    def __init__(self, dice=None):
+        # Where roll_dice() takes its rolls from (see dice.py): the global random module unless a
+        # seeded or scripted source is given.
+        self.dice_source = dice or GLOBAL_DICE
+        # State version: bumped by every mutator so cached move lists can be reused
+        # until the position, side to move or dice change. Code that mutates self.pos
+        # directly must bump it too.
+        self.version = 0
+        self._moves_key = None
+        self._moves = None
+        self._home_version = -1
+        self._home = False
+        # Board, bars, borne-off counts and side to move live in a compact Position;
+        # the attributes below are views onto it so callers see the same API as before.
+        self.pos = Position(self.initialize_board(), turn=1)  # 1 for white, -1 for black
         self.dice = (0, 0)
-        self.current_player = 1  # 1 for white, -1 for black
         self.game_over = False
-        self.bar_white = 0  # White checkers on the bar (jail)
-        self.bar_black = 0  # Black checkers on the bar
         self.moves_remaining = []  # Will be set when dice are rolled
-        self.borne_off_white = 0  # White checkers borne off
-        self.borne_off_black = 0  # Black checkers borne off
+
+    @property
+    def board(self):
+        """The 24 board points (positive for White, negative for Black), as a BoardView."""
+        return BoardView(self)
+
+    @board.setter
+    def board(self, board):
+        self.pos.points[1:25] = board
+        self.pos.rehash()
+        self.version += 1
+
+    @property
+    def current_player(self):
+        return self.pos.turn
+
+    @current_player.setter
+    def current_player(self, player):
+        if self.recorder:
+            self.recorder.turn(self, player)
+        self.pos.turn = player
+        self.pos.rehash()
+        self.version += 1
+
+    @property
+    def bar_white(self):
+        """White checkers on the bar (jail)."""
+        return self.pos.points[WHITE_BAR]
+
+    @bar_white.setter
+    def bar_white(self, count):
+        self.pos.points[WHITE_BAR] = count
+        self.pos.rehash()
+        self.version += 1
+
+    @property
+    def bar_black(self):
+        """Black checkers on the bar."""
+        return -self.pos.points[BLACK_BAR]
+
+    @bar_black.setter
+    def bar_black(self, count):
+        self.pos.points[BLACK_BAR] = -count
+        self.pos.rehash()
+        self.version += 1
+
+    @property
+    def borne_off_white(self):
+        return self.pos.off_white
+
+    @borne_off_white.setter
+    def borne_off_white(self, count):
+        self.pos.off_white = count
+        self.pos.rehash()
+        self.version += 1
+
+    @property
+    def borne_off_black(self):
+        return self.pos.off_black
+
+    @borne_off_black.setter
+    def borne_off_black(self, count):
+        self.pos.off_black = count
+        self.pos.rehash()
+        self.version += 1
 
 
     def initialize_board(self):
@@ -49,8 +162,9 @@ class Backgammon:
 
     def roll_dice(self):
         """Rolls two dice, sets the dice attribute and the moves_remaining based on the roll."""
-        die1 = random.randint(1, 6)
-        die2 = random.randint(1, 6)
+        die1, die2 = self.dice_source.roll()
+        if self.recorder:
+            self.recorder.roll(self, die1, die2)
         self.dice = (die1, die2)
         
         # If doubles are rolled, the player gets four moves.
@@ -58,6 +172,7 @@ class Backgammon:
             self.moves_remaining = [die1] * 4
         else:
             self.moves_remaining = [die1, die2]
+        self.version += 1
         
         return self.dice
 
@@ -72,12 +187,14 @@ class Backgammon:
         if start < 0 or start >= 24 or end < 0 or end >= 24:
             return False  # Out of bounds
 
+        board = self.board
+
         # There must be a checker at the starting point.
-        if self.board[start] == 0:
+        if board[start] == 0:
             return False
 
         # Ensure that the checker belongs to the current player.
-        if (self.board[start] > 0 and self.current_player == -1) or (self.board[start] < 0 and self.current_player == 1):
+        if (board[start] > 0 and self.current_player == -1) or (board[start] < 0 and self.current_player == 1):
             return False
 
         # Enforce movement direction:
@@ -90,10 +207,10 @@ class Backgammon:
 
         # Check destination occupancy: 
         # White cannot land on a point occupied by more than one black checker.
-        if self.board[end] < -1 and self.current_player == 1:
+        if board[end] < -1 and self.current_player == 1:
             return False
         # Black cannot land on a point occupied by more than one white checker.
-        if self.board[end] > 1 and self.current_player == -1:
+        if board[end] > 1 and self.current_player == -1:
             return False
         return True
 
@@ -113,45 +230,14 @@ class Backgammon:
                 break
         if move is None:
             return False  # The move is not legal
+        if self.recorder:
+            self.recorder.move(self, start, end)
         
-        # Extract the required dice value and move type from the move tuple
-        d = move[2]
-        move_type = move[3]
-        
-        # Execute based on move type:
-        if move_type == "re-entry":
-            # For white re-entry: start should be -1, destination between 0-5.
-            if self.current_player == 1:
-                self.board[end] += 1
-                self.bar_white -= 1
-            # For black re-entry: start should be 24, destination between 18-23.
-            else:
-                self.board[end] += -1
-                self.bar_black -= 1
-            self.moves_remaining.remove(d)
-        
-        elif move_type == "bear_off":
-            # Bearing off: remove checker from board and increment borne-off counter.
-            if self.current_player == 1:
-                self.board[start] -= 1
-                self.borne_off_white += 1
-            else:
-                self.board[start] += 1  # Since black checkers are negative.
-                self.borne_off_black += 1
-            self.moves_remaining.remove(d)
-        
-        elif move_type == "normal":
-            # Normal moves: update board positions and handle hitting if needed.
-            piece = 1 if self.current_player == 1 else -1
-            if self.current_player == 1 and self.board[end] == -1:
-                self.board[end] = 0
-                self.bar_black += 1
-            elif self.current_player == -1 and self.board[end] == 1:
-                self.board[end] = 0
-                self.bar_white += 1
-            self.board[end] += piece
-            self.board[start] -= piece
-            self.moves_remaining.remove(d)
+        # Apply the move on the position (handles re-entry, hits and bearing off)
+        # and remove the corresponding dice value.
+        self.pos.apply(move)
+        self.moves_remaining.remove(move[2])
+        self.version += 1
         
         # Check for game over.
 # 3. Check for game over (placeholder logic).
@@ -164,30 +250,45 @@ class Backgammon:
         if not self.moves_remaining or not self.can_make_any_move():
             self.current_player *= -1
             self.roll_dice()
+            self.pass_blocked_turns()
 
         return True
 
 
+    def pass_blocked_turns(self, limit=100):
+        """
+        While the game is on and the side to move has no legal move, passes the turn and rolls
+        for the other side. Call after rolling. limit stops the (rare) case where both sides are
+        closed out from passing forever.
+        """
+        for _ in range(limit):
+            if self.game_over or self.can_make_any_move():
+                return
+            self.current_player *= -1
+            self.roll_dice()
+
+
+    def resign(self, player):
+        """Ends the game with player (1 or -1) giving up, so the opponent wins."""
+        if self.recorder:
+            self.recorder.resign(self, player)
+        self.game_over = -player
+        self.version += 1
+
+
     def check_game_over(self):
         """Check if one player has won the game (all checkers off the board) and return:
         1 if White wins, -1 if Black wins, or False if game is not over."""
-        player1_checkers = sum(1 for i in self.board if i > 0)
-        player2_checkers = sum(1 for i in self.board if i < 0)
-        if player1_checkers == 0:
-            return 1  # White wins
-        elif player2_checkers == 0:
-            return -1  # Black wins
-        return False
+        return self.pos.winner()
 
 
     def get_board_state(self):
-        # If the game is not over and the current player has no legal moves,
-        # automatically switch turns and roll new dice.
-        if not self.game_over and not self.can_make_any_move():
-            self.current_player *= -1
-            self.roll_dice()
+        """
+        The full game state as a dictionary. Only reads the game: blocked turns are passed by
+        make_move() and pass_blocked_turns(), never here.
+        """
         return {
-            "board": self.board,
+            "board": self.pos.board,
             "dice": self.dice,
             "moves_remaining": self.moves_remaining,
             "current_player": self.current_player,
@@ -200,28 +301,30 @@ class Backgammon:
             "all_moves": self.get_all_available_moves()
         }
 
-    
+
+    def get_compact_state(self):
+        """
+        The game state in a few bytes: the GNU Backgammon style position ID of the board (seen from
+        the side to move) plus side to move, dice and game_over. Legal moves are left out.
+        """
+        return {
+            "position_id": self.pos.position_id(),
+            "current_player": self.current_player,
+            "dice": self.dice,
+            "moves_remaining": self.moves_remaining,
+            "game_over": self.game_over,
+        }
+
     def can_make_any_move(self):
         return len(self.get_all_available_moves()) > 0
 
 
     def all_in_home(self):
         """Return True if all checkers for the current player are in their home board and not on the bar."""
-        if self.current_player == 1:
-            # White: all white checkers must be on points 18-23.
-            for i in range(24):
-                if self.board[i] > 0 and not (18 <= i <= 23):
-                    return False
-            if self.bar_white > 0:
-                return False
-        else:
-            # Black: all black checkers must be on points 0-5.
-            for i in range(24):
-                if self.board[i] < 0 and not (0 <= i <= 5):
-                    return False
-            if self.bar_black > 0:
-                return False
-        return True
+        if self._home_version != self.version or not self.cache_moves:
+            self._home = self.pos.all_in_home()
+            self._home_version = self.version
+        return self._home
 
     def get_all_available_moves(self):
         """
@@ -269,67 +372,20 @@ class Backgammon:
                 is positioned at a higher index than 'start' (i.e. this checker is the furthest advanced),
                 add move: (start, -1, d, "bear_off").
         """
-        moves = []
-
-        # 1. Re-entry Moves:
-        if self.current_player == 1 and self.bar_white > 0:
-            for end in range(0, 6):
-                d = end + 1
-                if d in self.moves_remaining and self.board[end] >= -1:
-                    moves.append((-1, end, d, "re-entry"))
-        elif self.current_player == -1 and self.bar_black > 0:
-            for end in range(18, 24):
-                d = 24 - end
-                if d in self.moves_remaining and self.board[end] <= 1:
-                    moves.append((24, end, d, "re-entry"))
-
-        # 2. Normal Moves (only if no checkers on bar):
-        if (self.current_player == 1 and self.bar_white == 0) or (self.current_player == -1 and self.bar_black == 0):
-            for start in range(24):
-                if self.current_player == 1 and self.board[start] <= 0:
-                    continue
-                if self.current_player == -1 and self.board[start] >= 0:
-                    continue
-                for d in self.moves_remaining:
-                    if self.current_player == 1:
-                        end = start + d
-                    else:
-                        end = start - d
-                    if 0 <= end < 24 and self.is_valid_move(start, end):
-                        moves.append((start, end, d, "normal"))
-        
-        # 3. Bearing Off Moves:
-        if self.all_in_home():
-            if self.current_player == 1:
-                # White home: indices 18-23.
-                # Determine the furthest advanced white checker in home (lowest index)
-                white_home = [i for i in range(18, 24) if self.board[i] > 0]
-                furthest = min(white_home) if white_home else None
-                for start in range(18, 24):
-                    if self.board[start] <= 0:
-                        continue
-                    required = 24 - start
-                    if required in self.moves_remaining:
-                        moves.append((start, 24, required, "bear_off"))
-                    else:
-                        higher_options = [d for d in self.moves_remaining if d > required]
-                        if higher_options and furthest is not None and start == furthest:
-                            d = min(higher_options)
-                            moves.append((start, 24, d, "bear_off"))
-            elif self.current_player == -1:
-                # Black home: indices 0-5.
-                black_home = [i for i in range(0, 6) if self.board[i] < 0]
-                furthest = max(black_home) if black_home else None
-                for start in range(0, 6):
-                    if self.board[start] >= 0:
-                        continue
-                    required = start + 1
-                    if required in self.moves_remaining:
-                        moves.append((start, -1, required, "bear_off"))
-                    else:
-                        higher_options = [d for d in self.moves_remaining if d > required]
-                        if higher_options and furthest is not None and start == furthest:
-                            d = min(higher_options)
-                            moves.append((start, -1, d, "bear_off"))
-        
-        return moves
+        # Cached per state version and dice left; the returned list is shared, do not modify it.
+        key = (self.version, tuple(self.moves_remaining))
+        if key != self._moves_key or not self.cache_moves:
+            MOVEGEN_CALLS.inc(1, "miss")
+            self._moves = self.pos.moves(self.moves_remaining)
+            self._moves_key = key
+        else:
+            MOVEGEN_CALLS.inc(1, "hit")
+        return self._moves
+
+    def get_all_plays(self):
+        """
+        Returns every distinct legal full play for moves_remaining as (moves, position) pairs.
+        Each moves entry is a tuple of get_all_available_moves() style tuples that can be fed
+        to make_move in order. See position.legal_plays for the rules applied.
+        """
+        return legal_plays(self.pos, self.moves_remaining)
@@ -0,0 +1,276 @@
+# asynchronous AI moves. an AI turn is submitted as a job, computed on a worker pool from a copy of
+# the position and applied to the game when it finishes, so no request waits for the AI.
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import neural_ai
+import opening_book
+import rollout_ai
+import search_ai
+from game import Backgammon
+from position import Position
+from telemetry import record_decision
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+# Threads applying finished plays, so a game whose lock is busy only delays its own job.
+COMPLETION_THREADS = 4
+
+
+class QueueFull(Exception):
+    """Raised by JobManager.submit() when max_queued jobs are already waiting or running."""
+
+
+def compute_play(player, key, dice, budget):
+    """
+    Worker process entry point: the play chosen by the AI player ("neural", "search" or "rollout")
+    for the position Position.key() with dice left to play, as ([(start, end), ...], player used,
+    seconds, nodes searched).
+    """
+    game = Backgammon()
+    game.pos = Position.from_key(key)
+    game.moves_remaining = list(dice)
+    game.version += 1
+    if player == "neural" and neural_ai.default_network() is not None:
+        moves, info = neural_ai.choose_play(game)
+        nodes = info["candidates"]
+    elif player == "search":
+        moves, info = search_ai.choose_play(game, time_limit=budget)
+        nodes = info["nodes"]
+    else:
+        player = "rollout"
+        moves, info = rollout_ai.choose_play(game, budget=budget)
+        nodes = info["rollouts"]
+    return [(start, end) for start, end, _, _ in moves], player, info["seconds"], nodes
+
+
+class Job:
+    __slots__ = ("job_id", "game_id", "version", "budget", "status", "future", "created",
+                 "started", "finished", "error", "state")
+
+    def __init__(self, game_id, version, budget):
+        self.job_id = secrets.token_urlsafe(12)
+        self.game_id = game_id
+        self.version = version  # Game version the play was computed for.
+        self.budget = budget
+        self.status = QUEUED
+        self.future = None  # Pool future, once the job has been handed to a worker.
+        self.created = time.monotonic()
+        self.started = None
+        self.finished = None
+        self.error = None
+        self.state = None
+
+    def to_dict(self, state=True):
+        """JSON view of the job; with state, a finished job includes the game state after its play."""
+        data = {"job_id": self.job_id, "game_id": self.game_id, "status": self.status}
+        if self.error:
+            data["error"] = self.error
+        if state and self.state is not None:
+            data["state"] = self.state
+        return data
+
+
+class JobManager:
+    """
+    AI move jobs for live games.
+
+    submit() copies the position and queues it for a process pool, which is handed no more jobs
+    than it has workers. When the play comes back it is applied to the game under the session lock,
+    unless the game moved on in the meantime (the job then fails as stale) or the job was cancelled.
+    At most max_queued jobs can be waiting or running at once, and each game has at most one:
+    submitting again returns the game's current job. A job still unfinished grace seconds after
+    its budget, counted from when a worker took it, fails as timed out. Finished jobs are kept for
+    polling until max_finished newer ones have finished.
+    With book, positions in the opening book are answered at once instead of going to the pool.
+    """
+
+    def __init__(self, find_session, on_finished=None, workers=1, max_queued=64, max_finished=1000,
+                 player="neural", grace=2.0, book=True):
+        self.find_session = find_session
+        # on_finished(job, session) runs once for every job that is done, failed or cancelled. For a
+        # job that reached its game it runs with the session lock held; session is None if the game
+        # is gone or the job timed out or was cancelled.
+        self.on_finished = on_finished
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_finished = max_finished
+        self.player = player
+        self.grace = grace
+        self.book = book
+        self._pool = None
+        self._completions = None
+        self._lock = threading.Lock()
+        self._active = {}  # job_id -> Job, queued or running
+        self._by_game = {}  # game_id -> job_id of its active job
+        self._waiting = deque()  # (job, compute_play arguments) not yet handed to the pool
+        self._running = 0  # Pool futures not yet done, timed out jobs included.
+        self._finished = OrderedDict()
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            self._completions = ThreadPoolExecutor(COMPLETION_THREADS, thread_name_prefix="ai-job")
+        return self._pool
+
+    def submit(self, game_id, game, budget):
+        """
+        Starts an AI move job for game (with its session lock held) and returns the Job.
+        Raises QueueFull when the queue limit is reached.
+        """
+        with self._lock:
+            expired = self._expire()
+            current = self._active.get(self._by_game.get(game_id))
+            job = None
+            if current is None and len(self._active) < self.max_queued:
+                job = Job(game_id, game.version, budget)
+                self._active[job.job_id] = job
+                self._by_game[game_id] = job.job_id
+        self._notify(expired)
+        if current is not None:
+            return current
+        if job is None:
+            raise QueueFull()
+        moves = opening_book.book_play(game) if self.book else None
+        if moves is not None:
+            # Applied right away, still under the session lock.
+            self._finish(job, (moves, "book", 0.0, 0))
+            return job
+        with self._lock:
+            self._waiting.append((job, (self.player, game.pos.key(), tuple(game.moves_remaining), budget)))
+            self._dispatch()
+        return job
+
+    def _dispatch(self):
+        # Caller holds self._lock. ProcessPoolExecutor marks calls as running before a worker picks
+        # them up, so the pool only gets a job when a worker is free and the job's clock starts then.
+        while self._waiting and self._running < self.workers:
+            job, args = self._waiting.popleft()
+            if job.status != QUEUED:
+                continue  # Cancelled while waiting.
+            job.status = RUNNING
+            job.started = time.monotonic()
+            self._running += 1
+            job.future = self._get_pool().submit(compute_play, *args)
+            # Done callbacks run on the pool's manager thread, which must not wait for session
+            # locks or game loads, so the play is applied on a completion thread.
+            job.future.add_done_callback(lambda future, job=job: self._completions.submit(self._completed, job))
+            # Times the job out when its deadline passes, even if nobody polls it.
+            timer = threading.Timer(job.budget + self.grace, self._check_deadlines)
+            timer.daemon = True
+            timer.start()
+
+    def _completed(self, job):
+        """Completion thread task for a done pool future: starts the next job and finishes this one."""
+        with self._lock:
+            self._running -= 1
+            self._dispatch()
+        if job.future.cancelled():
+            return
+        error = job.future.exception()
+        self._finish(job, None if error else job.future.result(), error)
+
+    def get(self, job_id):
+        with self._lock:
+            expired = self._expire()
+            job = self._active.get(job_id) or self._finished.get(job_id)
+        self._notify(expired)
+        return job
+
+    def _expire(self):
+        # Caller holds self._lock. Returns the jobs that timed out, for _notify() once it is released.
+        now = time.monotonic()
+        expired = [job for job in self._active.values()
+                   if job.started is not None and now >= job.started + job.budget + self.grace]
+        for job in expired:
+            # The worker runs on; _finish() ignores its play.
+            self._retire(job, FAILED, "Timed out")
+        return expired
+
+    def _check_deadlines(self):
+        with self._lock:
+            expired = self._expire()
+        self._notify(expired)
+
+    def _notify(self, jobs):
+        # Reports jobs retired without reaching their game.
+        if self.on_finished:
+            for job in jobs:
+                self.on_finished(job, None)
+
+    def cancel(self, job_id):
+        """Cancels a queued or running job; its play is never applied. Returns the Job or None."""
+        with self._lock:
+            job = self._active.get(job_id)
+            if job is None:
+                return self._finished.get(job_id)
+            self._retire(job, CANCELLED)
+        # A job a worker has already started still runs to the end; _finish() ignores it.
+        if job.future is not None:
+            job.future.cancel()
+        self._notify([job])
+        return job
+
+    def cancel_game(self, game_id):
+        """Cancels the active job of game_id, if any (the player resigned or restarted)."""
+        with self._lock:
+            job_id = self._by_game.get(game_id)
+        if job_id is not None:
+            self.cancel(job_id)
+
+    def _retire(self, job, status, error=None):
+        # Caller holds self._lock.
+        job.status = status
+        job.error = error
+        job.finished = time.monotonic()
+        del self._active[job.job_id]
+        if self._by_game.get(job.game_id) == job.job_id:
+            del self._by_game[job.game_id]
+        self._finished[job.job_id] = job
+        while len(self._finished) > self.max_finished:
+            self._finished.popitem(last=False)
+
+    def _finish(self, job, result, error=None):
+        """
+        Applies a job's play (the compute_play() result) to the game and reports the job; with
+        error, the job fails instead. A play that comes back after the job's deadline is dropped.
+        """
+        self._check_deadlines()
+        session = self.find_session(job.game_id)
+        if session is None:
+            with self._lock:
+                if job.job_id not in self._active:
+                    return
+                self._retire(job, FAILED, "Unknown game")
+            if self.on_finished:
+                self.on_finished(job, None)
+            return
+        with session.lock:
+            game = session.game
+            with self._lock:
+                if job.job_id not in self._active:
+                    return  # Cancelled or timed out while running.
+                if error is not None:
+                    self._retire(job, FAILED, "AI failed: %s" % error)
+                elif game.version != job.version:
+                    self._retire(job, FAILED, "Game changed while the AI was thinking")
+                else:
+                    moves, player, seconds, nodes = result
+                    # The worker's own metrics stay in its process; book_play() already counted
+                    # book moves here.
+                    if player != "book":
+                        record_decision(player, seconds, nodes)
+                    for start, end in moves:
+                        game.make_move(start, end)
+                    job.state = game.get_board_state()
+                    self._retire(job, DONE)
+            if self.on_finished:
+                self.on_finished(job, session)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._completions.shutdown(wait=False, cancel_futures=True)
@@ -1,2 +1,294 @@
 # database models. defines user, game, and other databse tables
+#
+# Games are stored as an append-only event log in SQLite:
+#   games(id, created, seed)         one row per game, with the seed of its RandomDice if it has one
+#   events(game_id, seq, event)      every roll, turn change and move of a game, EVENT bytes each
+#   snapshots(game_id, seq, state)   the whole game state every SNAPSHOT_EVERY events, STATE bytes
+# A snapshot at seq n is the state after events 0..n-1, so loading a game replays only the
+# events since its last snapshot, and a seeded game's dice go on from where they stopped. All
+# writes go through one background thread that commits in batches, so requests only ever put
+# events on a queue.
+import argparse
+import atexit
+import json
+import os
+import queue
+import sqlite3
+import struct
+import threading
+import time
+from urllib.request import pathname2url
 
+from dice import RandomDice
+from game import Backgammon
+from position import Position
+
+# Event kinds, packed with two signed bytes: ROLL (die1, die2), TURN (player, 0), MOVE (start, end),
+# RESIGN (player, 0).
+ROLL, TURN, MOVE, RESIGN = 1, 2, 3, 4
+EVENT = struct.Struct("<Bbb")
+# Snapshot: 26 slots, off counts, side to move, dice, number of dice left + 4 dice, game_over.
+STATE = struct.Struct("<26b2Bb2BB4Bb")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (id TEXT PRIMARY KEY, created REAL NOT NULL, seed INTEGER);
+CREATE TABLE IF NOT EXISTS events (
+    game_id TEXT NOT NULL, seq INTEGER NOT NULL, event BLOB NOT NULL,
+    PRIMARY KEY (game_id, seq)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS snapshots (
+    game_id TEXT NOT NULL, seq INTEGER NOT NULL, state BLOB NOT NULL,
+    PRIMARY KEY (game_id, seq)) WITHOUT ROWID;
+"""
+
+
+def encode_state(game):
+    """Packs the full state of a Backgammon game into STATE bytes."""
+    pos = game.pos
+    remaining = list(game.moves_remaining) + [0] * (4 - len(game.moves_remaining))
+    return STATE.pack(*pos.points, pos.off_white, pos.off_black, pos.turn, *game.dice,
+                      len(game.moves_remaining), *remaining, game.game_over or 0)
+
+
+def decode_state(data):
+    """Backgammon game in the state packed by encode_state()."""
+    values = STATE.unpack(data)
+    game = Backgammon()
+    game.pos = Position.from_key(values[:29])
+    game.dice = values[29:31]
+    game.moves_remaining = list(values[32:32 + values[31]])
+    game.game_over = values[36] or False
+    game.version += 1
+    return game
+
+
+def apply_event(game, kind, a, b):
+    """Replays one recorded event on game."""
+    if kind == ROLL:
+        # Same effect as the recorded roll_dice() call, with its dice.
+        game.dice = (a, b)
+        game.moves_remaining = [a] * 4 if a == b else [a, b]
+        game.version += 1
+    elif kind == TURN:
+        game.current_player = a
+    elif kind == MOVE:
+        # make_move() may end the turn and roll; the TURN and ROLL events that follow set the
+        # recorded values.
+        game.make_move(a, b)
+    elif kind == RESIGN:
+        game.resign(a)
+    else:
+        raise ValueError("Unknown event kind %r" % kind)
+
+
+class GameRecorder:
+    """Backgammon.recorder that appends a game's events (and periodic snapshots) to a GameStore."""
+
+    def __init__(self, store, game_id, seq=0):
+        self.store = store
+        self.game_id = game_id
+        self.seq = seq
+
+    def _append(self, game, kind, a, b):
+        # Called before the event changes the game, so the snapshot is the state after seq events.
+        if self.seq and self.seq % self.store.snapshot_every == 0:
+            self.store.put(("snapshot", self.game_id, self.seq, encode_state(game)))
+        self.store.put(("event", self.game_id, self.seq, EVENT.pack(kind, a, b)))
+        self.seq += 1
+
+    def roll(self, game, die1, die2):
+        self._append(game, ROLL, die1, die2)
+
+    def turn(self, game, player):
+        self._append(game, TURN, player, 0)
+
+    def move(self, game, start, end):
+        self._append(game, MOVE, start, end)
+
+    def resign(self, game, player):
+        self._append(game, RESIGN, player, 0)
+
+
+class GameStore:
+    """
+    SQLite-backed game log.
+
+    put() only queues a write. A background thread writes queued items in one transaction once
+    batch items are waiting or interval seconds have passed since the first one, so a request
+    never waits for the disk. flush() blocks until everything queued so far is committed.
+    """
+
+    def __init__(self, path, batch=256, interval=0.5, snapshot_every=32):
+        self.path = path
+        self.batch = batch
+        self.interval = interval
+        self.snapshot_every = snapshot_every
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            if "seed" not in [row[1] for row in conn.execute("PRAGMA table_info(games)")]:
+                # Files written before seeds were stored.
+                conn.execute("ALTER TABLE games ADD COLUMN seed INTEGER")
+        conn.close()
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._writer, name="game-store", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def put(self, item):
+        self._queue.put(item)
+
+    def _writer(self):
+        conn = self._connect()
+        running = True
+        while running:
+            items = [self._queue.get()]
+            deadline = time.monotonic() + self.interval
+            while len(items) < self.batch and not isinstance(items[-1], threading.Event) \
+                    and items[-1] is not None:
+                try:
+                    items.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            games, events, snapshots, waiters = [], [], [], []
+            for item in items:
+                if item is None:
+                    running = False
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                elif item[0] == "event":
+                    events.append(item[1:])
+                elif item[0] == "snapshot":
+                    snapshots.append(item[1:])
+                else:
+                    games.append(item[1:])
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO games VALUES (?, ?, ?)", games)
+                conn.executemany("INSERT OR REPLACE INTO events VALUES (?, ?, ?)", events)
+                conn.executemany("INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?)", snapshots)
+            for waiter in waiters:
+                waiter.set()
+        conn.close()
+
+    def flush(self):
+        """Waits until everything put so far is committed."""
+        if self._thread.is_alive():
+            done = threading.Event()
+            self.put(done)
+            done.wait()
+
+    def close(self):
+        """Commits what is queued and stops the writer thread."""
+        if self._thread.is_alive():
+            self.put(None)
+            self._thread.join()
+
+    def new_game(self, game_id, game):
+        """
+        Starts recording game (in its opening state) under game_id. The seed of a RandomDice
+        source is stored with it, so a loaded game rolls the same dice it would have.
+        """
+        self.put(("game", game_id, time.time(), getattr(game.dice_source, "seed", None)))
+        game.recorder = GameRecorder(self, game_id)
+
+    def load(self, game_id):
+        """
+        Rebuilds a stored game from its last snapshot and the events after it and keeps recording
+        it. A game stored with a dice seed gets its RandomDice back, moved past the rolls already
+        made. Returns None if game_id was never stored.
+        """
+        self.flush()
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT seed FROM games WHERE id = ?", (game_id,)).fetchone()
+            if row is None:
+                return None
+            dice_seed = row[0]
+            row = conn.execute("SELECT seq, state FROM snapshots WHERE game_id = ? ORDER BY seq DESC LIMIT 1",
+                               (game_id,)).fetchone()
+            seq, game = (row[0], decode_state(row[1])) if row else (0, Backgammon())
+            for seq, event in conn.execute("SELECT seq, event FROM events WHERE game_id = ? AND seq >= ? "
+                                           "ORDER BY seq", (game_id, seq)):
+                apply_event(game, *EVENT.unpack(event))
+                seq += 1
+            if dice_seed is not None:
+                # Replayed moves rolled from the default source; the recorded rolls set the dice.
+                rolls = conn.execute("SELECT COUNT(*) FROM events WHERE game_id = ? AND substr(event, 1, 1) = ?",
+                                     (game_id, bytes([ROLL]))).fetchone()[0]
+                game.dice_source = RandomDice(dice_seed)
+                for _ in range(rolls):
+                    game.dice_source.roll()
+        finally:
+            conn.close()
+        game.recorder = GameRecorder(self, game_id, seq)
+        return game
+
+    def export(self):
+        """
+        Streams every stored game as (game_id, [(kind, a, b), ...]) in game id order. Rows are read
+        through one cursor, so only the current game is held in memory.
+        """
+        self.flush()
+        conn = self._connect()
+        try:
+            yield from _stream_events(conn)
+        finally:
+            conn.close()
+
+
+def _stream_events(conn):
+    # (game_id, events) for every game in conn, see GameStore.export().
+    game_id, events = None, []
+    for row_id, event in conn.execute("SELECT game_id, event FROM events ORDER BY game_id, seq"):
+        if row_id != game_id:
+            if game_id is not None:
+                yield game_id, events
+            game_id, events = row_id, []
+        events.append(EVENT.unpack(event))
+    if game_id is not None:
+        yield game_id, events
+
+
+def read_archive(path):
+    """
+    Streams the games of the database file path like GameStore.export(), opened read-only: the
+    file is never created, migrated or written. Raises FileNotFoundError right away if it does
+    not exist.
+    """
+    if not os.path.isfile(path):
+        raise FileNotFoundError("no game database at %s" % path)
+    conn = sqlite3.connect("file:%s?mode=ro" % pathname2url(os.path.abspath(path)), uri=True)
+    return _closing(conn, _stream_events(conn))
+
+
+def _closing(conn, rows):
+    try:
+        yield from rows
+    finally:
+        conn.close()
+
+
+def main():
+    import config
+
+    parser = argparse.ArgumentParser(description="Export stored games as JSON lines.")
+    parser.add_argument("out", help="output file, one {game_id, events} object per line")
+    parser.add_argument("--db", default=config.DATABASE_PATH)
+    args = parser.parse_args()
+
+    store = GameStore(args.db)
+    count = 0
+    with open(args.out, "w") as f:
+        for game_id, events in store.export():
+            f.write(json.dumps({"game_id": game_id, "events": events}) + "\n")
+            count += 1
+    store.close()
+    print("exported %d games to %s" % (count, args.out))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,300 @@
+# neural network AI. a small TD-Gammon style network in numpy: features, batched evaluation of all
+# plays of a turn, TD(lambda) self-play training and checkpoints.
+# train with: python neural_ai.py train --games 20000 --workers 4
+import argparse
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from bearoff import best_race_play
+from datafiles import DataFile
+from game import Backgammon
+from position import legal_plays
+from telemetry import record_decision
+
+# Features per position, seen from one side ("own" checkers move towards their home board):
+#   4 per point and side (at least 1, 2, 3 checkers, and (n - 3) / 2 beyond that): 2 * 24 * 4
+#   own bar / 2, opponent bar / 2, own off / 15, opponent off / 15
+FEATURES = 2 * 24 * 4 + 4
+HIDDEN = 40
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "neural_weights.npz")
+
+
+def encode(points, off, side):
+    """
+    Feature matrix (N, FEATURES) for N positions seen from side.
+
+    points is (N, 26) in the Position.points layout, off is (N, 2) borne-off counts [white, black]
+    and side is (N,) with 1 or -1. Black positions are mirrored so that both colours look alike to
+    the network: own checkers are positive and sit at distance 25 - slot from bearing off.
+    """
+    points = np.asarray(points, dtype=np.int8) * np.asarray(side, dtype=np.int8)[:, None]
+    black = np.asarray(side) == -1
+    points[black] = points[black, ::-1]
+    own = np.maximum(points[:, 1:25], 0).astype(np.float32)
+    opp = np.maximum(-points[:, 1:25], 0).astype(np.float32)
+    off = np.asarray(off, dtype=np.float32)
+    own_off = np.where(black, off[:, 1], off[:, 0])
+    opp_off = np.where(black, off[:, 0], off[:, 1])
+
+    n = len(points)
+    x = np.empty((n, FEATURES), dtype=np.float32)
+    for i, counts in enumerate((own, opp)):
+        block = x[:, i * 96:(i + 1) * 96].reshape(n, 24, 4)
+        block[:, :, 0] = counts >= 1
+        block[:, :, 1] = counts >= 2
+        block[:, :, 2] = counts >= 3
+        block[:, :, 3] = np.maximum(counts - 3, 0) / 2
+    x[:, 192] = points[:, 0] / 2
+    x[:, 193] = -points[:, 25] / 2
+    x[:, 194] = own_off / 15
+    x[:, 195] = opp_off / 15
+    return x
+
+
+def encode_positions(positions, side):
+    """encode() for a list of Position objects, all seen from side."""
+    points = [p.points for p in positions]
+    off = [(p.off_white, p.off_black) for p in positions]
+    return encode(points, off, np.full(len(positions), side, dtype=np.int8))
+
+
+def _sigmoid(z):
+    return 1.0 / (1.0 + np.exp(-z))
+
+
+class Network:
+    """
+    FEATURES -> HIDDEN sigmoid -> 1 sigmoid. The output is the chance that the side the features
+    are seen from wins, for a position where that side has just played and the opponent rolls next.
+    """
+
+    def __init__(self, hidden=HIDDEN, seed=None):
+        rng = np.random.default_rng(seed)
+        self.w1 = rng.normal(0.0, 0.1, (FEATURES, hidden)).astype(np.float32)
+        self.b1 = np.zeros(hidden, dtype=np.float32)
+        self.w2 = rng.normal(0.0, 0.1, hidden).astype(np.float32)
+        self.b2 = np.zeros(1, dtype=np.float32)
+        self.games = 0
+
+    def weights(self):
+        """The weight arrays; updating them in place updates the network."""
+        return [self.w1, self.b1, self.w2, self.b2]
+
+    def set_weights(self, weights):
+        self.w1, self.b1, self.w2, self.b2 = (np.array(w, dtype=np.float32) for w in weights)
+
+    def forward(self, x):
+        """Win chances (N,) for the feature rows of x, one matrix multiply per layer."""
+        return _sigmoid(_sigmoid(x @ self.w1 + self.b1) @ self.w2 + self.b2)
+
+    def gradient(self, x):
+        """Output and gradients of the output for a single feature row, in weights() order."""
+        h = _sigmoid(x @ self.w1 + self.b1)
+        y = float(_sigmoid(h @ self.w2 + self.b2[0]))
+        dy = y * (1.0 - y)
+        dh = dy * self.w2 * h * (1.0 - h)
+        return y, [np.outer(x, dh), dh, dy * h, np.array([dy], dtype=np.float32)]
+
+    def best_play(self, plays, side):
+        """Index and win chance of the best of plays (legal_plays() output) for side."""
+        values = self.forward(encode_positions([child for _, child in plays], side))
+        i = int(np.argmax(values))
+        return i, float(values[i])
+
+    def equity(self, pos):
+        """
+        Equity in [-1, 1] for the side to move in pos, as used by ExpectiminimaxSearch: pos is seen
+        from the side that just played.
+        """
+        return 1.0 - 2.0 * float(self.forward(encode_positions([pos], -pos.turn))[0])
+
+    def save(self, path=DEFAULT_PATH):
+        """Writes the weights as float32 to a compressed .npz file (about 30 KB)."""
+        w1, b1, w2, b2 = self.weights()
+        tmp = path + ".tmp.npz"
+        np.savez_compressed(tmp, w1=w1, b1=b1, w2=w2, b2=b2, games=np.int64(self.games))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path=DEFAULT_PATH):
+        with np.load(path) as data:
+            net = cls(hidden=data["w1"].shape[1])
+            net.set_weights([data["w1"], data["b1"], data["w2"], data["b2"]])
+            net.games = int(data["games"])
+        return net
+
+
+def self_play_game(net, rng, alpha=0.1, lam=0.7, max_turns=1000):
+    """
+    Plays one game of net against itself, choosing every play greedily, and updates net in place
+    with TD(lambda).
+
+    Values are tracked from White's view: W_t is the network output for the position after turn t
+    (flipped for Black's turns) and the last target is the result. Returns the winner.
+    """
+    pos = Backgammon().pos.copy()
+    pos.turn = rng.choice((1, -1))
+    pos.rehash()
+    weights = net.weights()
+    traces = [np.zeros_like(w) for w in weights]
+    previous = None
+    winner = 0
+    for _ in range(max_turns):
+        d1, d2 = rng.randint(1, 6), rng.randint(1, 6)
+        plays = legal_plays(pos, [d1] * 4 if d1 == d2 else [d1, d2])
+        side = pos.turn
+        i, _ = net.best_play(plays, side)
+        pos = plays[i][1]
+        winner = pos.winner()
+        if winner:
+            value = 1.0 if winner == 1 else 0.0
+        else:
+            y, grads = net.gradient(encode_positions([pos], side)[0])
+            value = y if side == 1 else 1.0 - y
+        if previous is not None:
+            delta = alpha * (value - previous)
+            for w, e in zip(weights, traces):
+                w += delta * e
+        if winner:
+            break
+        for e, g in zip(traces, grads):
+            e *= lam
+            if side == 1:
+                e += g
+            else:
+                e -= g
+        previous = value
+        pos.switch_turn()
+    net.games += 1
+    return winner
+
+
+def _train_task(weights, hidden, seed, games, alpha, lam):
+    """Worker task: trains a copy of the network on `games` games, returns the weight change."""
+    net = Network(hidden)
+    net.set_weights(weights)
+    start = [w.copy() for w in net.weights()]
+    rng = random.Random(seed)
+    wins = 0
+    for _ in range(games):
+        wins += self_play_game(net, rng, alpha, lam) == 1
+    return [w - s for w, s in zip(net.weights(), start)], wins
+
+
+def train(net, games, workers=0, alpha=0.1, lam=0.7, seed=0, path=None, every=1000, chunk=50, log=print):
+    """
+    Trains net by self-play for `games` games.
+
+    Without workers the games run here with online updates. With workers each round hands the
+    current weights to every worker, lets each play `chunk` games on its own copy and adds the
+    average of their weight changes. Saves a checkpoint to path every `every` games and at the end.
+    """
+    rng = random.Random(seed)
+    t0 = time.perf_counter()
+    played = 0
+    next_checkpoint = every
+    pool = ProcessPoolExecutor(workers) if workers else None
+    try:
+        while played < games:
+            if pool:
+                n = min(chunk, (games - played + workers - 1) // workers)
+                futures = [pool.submit(_train_task, net.weights(), len(net.b1), rng.getrandbits(64),
+                                       n, alpha, lam) for _ in range(workers)]
+                results = [f.result() for f in futures]
+                net.set_weights([w + sum(r[0][k] for r in results) / workers
+                                 for k, w in enumerate(net.weights())])
+                net.games += n * workers
+                played += n * workers
+            else:
+                self_play_game(net, rng, alpha, lam)
+                played += 1
+            if played >= next_checkpoint or played >= games:
+                next_checkpoint += every
+                if path:
+                    net.save(path)
+                if log:
+                    elapsed = time.perf_counter() - t0
+                    log("%d games (%d total), %.1f games/s" % (played, net.games, played / elapsed))
+    finally:
+        if pool:
+            pool.shutdown()
+    return net
+
+
+_default = DataFile(DEFAULT_PATH, Network.load, "no trained network at %s, the neural player falls "
+                    "back to rollouts; train one with: python neural_ai.py train")
+
+
+def default_network():
+    """The network saved at DEFAULT_PATH, loaded on first use; None while there is no checkpoint."""
+    return _default.get()
+
+
+def choose_play(game, net=None):
+    """
+    Picks the full play for the side to move whose resulting position the network rates best.
+    All candidate positions are evaluated in one batch. Pure bear-off races are played from the
+    bear-off database instead, when it has been built. Returns (moves, info).
+    """
+    t0 = time.perf_counter()
+    plays = game.get_all_plays()
+    race = best_race_play(game.pos, plays)
+    if race is not None:
+        i, value = race
+    else:
+        net = net or default_network()
+        i, value = net.best_play(plays, game.current_player)
+    info = {"candidates": len(plays), "win_chance": value, "bearoff": race is not None,
+            "seconds": time.perf_counter() - t0}
+    record_decision("neural", info["seconds"], info["candidates"])
+    return plays[i][0], info
+
+
+def Neural_ai_move(game, net=None):
+    """
+    Plays Black's turn (current_player == -1) with the play chosen by the neural network.
+
+    Args:
+        game: The Backgammon game instance.
+        net: The Network to use (defaults to the checkpoint at DEFAULT_PATH).
+
+    Returns:
+        The updated board state as a dictionary.
+    """
+    if game.current_player != -1 or game.game_over:
+        return game.get_board_state()
+    moves, _ = choose_play(game, net)
+    for start, end, _, _ in moves:
+        game.make_move(start, end)
+    return game.get_board_state()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the neural network AI by TD(lambda) self-play.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    train_parser = sub.add_parser("train")
+    train_parser.add_argument("--games", type=int, default=10000)
+    train_parser.add_argument("--workers", type=int, default=0, help="worker processes (0 trains in this process)")
+    train_parser.add_argument("--alpha", type=float, default=0.1)
+    train_parser.add_argument("--lam", type=float, default=0.7)
+    train_parser.add_argument("--hidden", type=int, default=HIDDEN)
+    train_parser.add_argument("--seed", type=int, default=0)
+    train_parser.add_argument("--every", type=int, default=1000, help="games between checkpoints")
+    train_parser.add_argument("--path", default=DEFAULT_PATH)
+    train_parser.add_argument("--fresh", action="store_true", help="start from random weights")
+    args = parser.parse_args()
+
+    if not args.fresh and os.path.exists(args.path):
+        net = Network.load(args.path)
+    else:
+        net = Network(args.hidden, seed=args.seed)
+    train(net, args.games, args.workers, args.alpha, args.lam, args.seed, args.path, args.every)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+# opening book. the play to make for early positions, keyed by position hash and roll, so the AI
+# answers the first moves of a game without searching.
+# build it with: python opening_book.py build --plies 2 --player search --budget 0.5
+import argparse
+import bisect
+import mmap
+import os
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from datafiles import DataFile
+from game import Backgammon
+from position import ROLLS, legal_plays
+from telemetry import record_decision
+
+MAGIC = b"BGOB"
+HEADER = struct.Struct("<4sHI")  # magic, version, entries
+# Entry: zobrist hash of the position (side to move included), roll index, number of checker
+# moves, then up to 4 (start, end) pairs. Entries are sorted by (zobrist, roll).
+RECORD = struct.Struct("<QBB8b")
+KEY = struct.Struct("<QB")
+VERSION = 1
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "opening_book.bin")
+
+
+def roll_index(d1, d2):
+    """0..35 index of a roll, the same for both orders of the dice."""
+    lo, hi = sorted((d1, d2))
+    return (lo - 1) * 6 + hi - 1
+
+
+def _dice(roll):
+    # Dice to play for one of the ROLLS entries, and its roll_index().
+    return list(roll), roll_index(roll[0], roll[-1])
+
+
+def _complete(pos, dice, moves):
+    """True if moves ([(start, end), ...]) is a legal full play of dice in pos."""
+    pos = pos.copy()
+    remaining = list(dice)
+    for start, end in moves:
+        move = next((m for m in pos.moves(remaining) if m[0] == start and m[1] == end), None)
+        if move is None:
+            return False
+        pos.apply(move)
+        remaining.remove(move[2])
+    return not remaining or not pos.moves(remaining)
+
+
+class OpeningBook:
+    """
+    Read-only view of a book file. The file is memory-mapped and searched by bisection, so
+    opening it costs nothing and a lookup reads a handful of records.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.entries = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION or len(self._map) != HEADER.size + self.entries * RECORD.size:
+            self._map.close()
+            raise ValueError("%s is not an opening book of this version" % path)
+
+    def __len__(self):
+        return self.entries
+
+    def close(self):
+        self._map.close()
+
+    def _key(self, i):
+        return KEY.unpack_from(self._map, HEADER.size + i * RECORD.size)
+
+    def lookup(self, zobrist, roll):
+        """The book play ([(start, end), ...]) for a position hash and roll_index(), or None."""
+        i = bisect.bisect_left(range(self.entries), (zobrist, roll), key=self._key)
+        if i == self.entries or self._key(i) != (zobrist, roll):
+            return None
+        values = RECORD.unpack_from(self._map, HEADER.size + i * RECORD.size)
+        return [(values[3 + 2 * k], values[4 + 2 * k]) for k in range(values[2])]
+
+    def play(self, game):
+        """
+        The book play for the side to move in game, or None if the roll has been partly played
+        or the position is not in the book. The play is checked against the position, so a hash
+        collision can never produce an illegal move.
+        """
+        d1, d2 = game.dice
+        if not d1 or sorted(game.moves_remaining) != ([d1] * 4 if d1 == d2 else sorted((d1, d2))):
+            return None
+        moves = self.lookup(game.pos.zobrist, roll_index(d1, d2))
+        if moves is None or not _complete(game.pos, game.moves_remaining, moves):
+            return None
+        return moves
+
+
+_default = DataFile(DEFAULT_PATH, OpeningBook, "no opening book at %s, openings are searched; "
+                    "build it with: python opening_book.py build")
+
+
+def default_book():
+    """The book at DEFAULT_PATH, opened on first use; None while it has not been built."""
+    return _default.get()
+
+
+def book_play(game):
+    """
+    The default book's play ([(start, end), ...]) for the side to move in game, or None. Meant to
+    be tried before any search: a hit takes microseconds.
+    """
+    book = default_book()
+    if book is None:
+        return None
+    t0 = time.perf_counter()
+    moves = book.play(game)
+    if moves is not None:
+        record_decision("book", time.perf_counter() - t0, 0)
+    return moves
+
+
+def _likely_plays(pos, dice, chosen, branch):
+    """
+    Positions after the chosen play and the branch - 1 other plays the neural network rates best
+    (the replies worth preparing for), with the opponent to move.
+    """
+    import neural_ai
+
+    plays = legal_plays(pos, dice)
+    picked = [i for i, (moves, _) in enumerate(plays) if [(s, e) for s, e, _, _ in moves] == chosen]
+    net = neural_ai.default_network()
+    if net is not None and branch > 1:
+        values = net.forward(neural_ai.encode_positions([child for _, child in plays], pos.turn))
+        ranked = [i for i in sorted(range(len(plays)), key=lambda i: -values[i]) if i not in picked]
+        picked += ranked[:branch - 1]
+    children = [plays[i][1] for i in picked]
+    for child in children:
+        child.switch_turn()
+    return children
+
+
+def build(path=DEFAULT_PATH, plies=2, branch=3, player="search", budget=0.5, workers=0, progress=None):
+    """
+    Builds a book covering plies turns from the starting position (with either side to move) and
+    writes it to path.
+
+    Every position of a ply gets a play for each of the 21 rolls from jobs.compute_play with
+    player ("rollout", "search" or "neural") and budget seconds. The next ply holds the positions
+    after the chosen play and after the other branch - 1 plays the neural network likes best, so
+    the book also covers the replies an opponent is likely to make. Returns the number of entries.
+    """
+    from jobs import compute_play
+
+    frontier = {}
+    for side in (1, -1):
+        game = Backgammon()
+        game.pos.turn = side
+        game.pos.rehash()
+        frontier[game.pos.zobrist] = game.pos
+    entries = {}
+    pool = ProcessPoolExecutor(workers) if workers else None
+    try:
+        for ply in range(plies):
+            tasks = [(pos, roll) for pos in frontier.values() for roll, _ in ROLLS
+                     if (pos.zobrist, _dice(roll)[1]) not in entries]
+            args = ([player] * len(tasks), [pos.key() for pos, _ in tasks], [roll for _, roll in tasks],
+                    [budget] * len(tasks))
+            results = pool.map(compute_play, *args) if pool else map(compute_play, *args)
+            next_frontier = {}
+            for done, ((pos, roll), (moves, _, _, _)) in enumerate(zip(tasks, results), 1):
+                dice, index = _dice(roll)
+                entries[pos.zobrist, index] = moves
+                if ply + 1 < plies:
+                    for child in _likely_plays(pos, dice, moves, branch):
+                        next_frontier.setdefault(child.zobrist, child)
+                if progress:
+                    progress(ply, done, len(tasks))
+            frontier = next_frontier
+    finally:
+        if pool:
+            pool.shutdown()
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(entries)))
+        for (zobrist, index), moves in sorted(entries.items()):
+            pairs = [v for move in moves for v in move] + [0] * (8 - 2 * len(moves))
+            f.write(RECORD.pack(zobrist, index, len(moves), *pairs))
+    os.replace(tmp, path)
+    return len(entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or inspect the opening book.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_parser = sub.add_parser("build")
+    build_parser.add_argument("--path", default=DEFAULT_PATH)
+    build_parser.add_argument("--plies", type=int, default=2, help="turns from the start to cover")
+    build_parser.add_argument("--branch", type=int, default=3, help="plays followed per position and roll")
+    build_parser.add_argument("--player", choices=("rollout", "search", "neural"), default="search")
+    build_parser.add_argument("--budget", type=float, default=0.5, help="seconds per position and roll")
+    build_parser.add_argument("--workers", type=int, default=0, help="worker processes (0 builds in this process)")
+    stats_parser = sub.add_parser("stats")
+    stats_parser.add_argument("--path", default=DEFAULT_PATH)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        t0 = time.perf_counter()
+
+        def progress(ply, done, total):
+            if done % 50 == 0 or done == total:
+                print("ply %d: %d / %d" % (ply + 1, done, total), file=sys.stderr)
+
+        count = build(args.path, args.plies, args.branch, args.player, args.budget, args.workers, progress)
+        print("wrote %d entries to %s in %.1fs" % (count, args.path, time.perf_counter() - t0))
+    else:
+        book = OpeningBook(args.path)
+        game = Backgammon()
+        hits = 0
+        for roll, _ in ROLLS:
+            game.moves_remaining = list(roll)
+            game.dice = (roll[0], roll[-1])
+            hits += book.play(game) is not None
+        print("%d entries, %d bytes; %d of 21 opening rolls for White covered"
+              % (len(book), HEADER.size + len(book) * RECORD.size, hits))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,386 @@
+# compact board representation. shared by the game engine, the AIs and anything that searches ahead.
+import base64
+import random
+
+WHITE = 1
+BLACK = -1
+
+# Slot layout of Position.points (26 entries):
+#   0      -> white bar (count >= 0)
+#   1..24  -> board points 0..23 (positive for white, negative for black)
+#   25     -> black bar (stored negative, like black checkers on the board)
+# A board index i lives in slot i + 1, so the bar "start" values used by moves
+# (-1 for white, 24 for black) map straight onto slots 0 and 25.
+WHITE_BAR = 0
+BLACK_BAR = 25
+
+# The 21 distinct rolls with their probabilities, doubles first (they are the most forcing).
+ROLLS = [((d, d, d, d), 1 / 36) for d in range(1, 7)] + \
+        [((d1, d2), 2 / 36) for d1 in range(1, 7) for d2 in range(d1 + 1, 7)]
+
+# Zobrist keys. ZOBRIST[slot][count] for counts -15..15: negative counts index from the end
+# of the 31-entry row, so every count gets its own key. An empty slot hashes to 0.
+_zobrist_rng = random.Random(0x6A6D)
+ZOBRIST = [[0] + [_zobrist_rng.getrandbits(64) for _ in range(30)] for _ in range(26)]
+ZOBRIST_OFF_WHITE = [0] + [_zobrist_rng.getrandbits(64) for _ in range(15)]
+ZOBRIST_OFF_BLACK = [0] + [_zobrist_rng.getrandbits(64) for _ in range(15)]
+ZOBRIST_BLACK_TO_MOVE = _zobrist_rng.getrandbits(64)
+
+
+class Position:
+    """
+    A backgammon position: the 26 slots, borne-off counts and side to move.
+
+    Moves use the same tuples as Backgammon.get_all_available_moves():
+    (start, end, dice_value, move_type). apply() plays a move in place and
+    undo() takes it back exactly (hits and bear-offs included), so search code
+    can walk the tree without copying positions.
+
+    zobrist is a 64-bit hash of the whole position, kept up to date by apply(),
+    undo() and switch_turn(). Code that writes to points or the off counts
+    directly must call rehash() afterwards.
+    """
+
+    __slots__ = ("points", "off_white", "off_black", "turn", "zobrist", "_hits")
+
+    def __init__(self, board=None, bar_white=0, bar_black=0, off_white=0, off_black=0, turn=WHITE):
+        self.points = [0] * 26
+        if board is not None:
+            self.points[1:25] = board
+        self.points[WHITE_BAR] = bar_white
+        self.points[BLACK_BAR] = -bar_black
+        self.off_white = off_white
+        self.off_black = off_black
+        self.turn = turn
+        self._hits = []  # Undo stack: whether each applied move hit a blot.
+        self.rehash()
+
+    @classmethod
+    def from_key(cls, key):
+        """Rebuilds a position from key()."""
+        pos = cls.__new__(cls)
+        pos.points = list(key[:26])
+        pos.off_white, pos.off_black, pos.turn = key[26:]
+        pos._hits = []
+        pos.rehash()
+        return pos
+
+    def copy(self):
+        """Returns an independent copy (the undo history is not copied)."""
+        new = Position.__new__(Position)
+        new.points = self.points[:]
+        new.off_white = self.off_white
+        new.off_black = self.off_black
+        new.turn = self.turn
+        new.zobrist = self.zobrist
+        new._hits = []
+        return new
+
+    def rehash(self):
+        """Recomputes zobrist from scratch."""
+        h = ZOBRIST_OFF_WHITE[self.off_white] ^ ZOBRIST_OFF_BLACK[self.off_black]
+        for slot, count in enumerate(self.points):
+            h ^= ZOBRIST[slot][count]
+        if self.turn == BLACK:
+            h ^= ZOBRIST_BLACK_TO_MOVE
+        self.zobrist = h
+
+    def key(self):
+        """Hashable snapshot of the position, used for transposition checks."""
+        return (*self.points, self.off_white, self.off_black, self.turn)
+
+    @property
+    def board(self):
+        """The 24 board points as a plain list (a copy)."""
+        return self.points[1:25]
+
+    @property
+    def bar_white(self):
+        return self.points[WHITE_BAR]
+
+    @property
+    def bar_black(self):
+        return -self.points[BLACK_BAR]
+
+    def position_id(self):
+        """
+        GNU Backgammon position ID: 14 base64 characters for the checkers on the board and bar.
+
+        For the side to move and then its opponent, each of its points from its ace point up to
+        its bar adds one 1 bit per checker and a 0 bit, giving 80 bits that are packed least
+        significant bit first into 10 bytes. The side to move is not part of the ID.
+        """
+        bits = 0
+        n = 0
+        for side in (self.turn, -self.turn):
+            for point in range(1, 26):
+                count = max(self.points[25 - point if side == WHITE else point] * side, 0)
+                bits |= ((1 << count) - 1) << n
+                n += count + 1
+        return base64.b64encode(bits.to_bytes(10, "little")).decode("ascii")[:14]
+
+    @classmethod
+    def from_position_id(cls, position_id, turn=WHITE):
+        """Rebuilds the position with turn to move from position_id(); off counts follow from it."""
+        bits = int.from_bytes(base64.b64decode(position_id + "=="), "little")
+        points = [0] * 26
+        for side in (turn, -turn):
+            for point in range(1, 26):
+                count = 0
+                while bits & 1:
+                    count += 1
+                    bits >>= 1
+                bits >>= 1
+                if count:
+                    points[25 - point if side == WHITE else point] = count * side
+        pos = cls(turn=turn)
+        pos.points = points
+        pos.off_white = 15 - sum(c for c in points if c > 0)
+        pos.off_black = 15 + sum(c for c in points if c < 0)
+        pos.rehash()
+        return pos
+
+    def switch_turn(self):
+        self.turn = -self.turn
+        self.zobrist ^= ZOBRIST_BLACK_TO_MOVE
+
+    def apply(self, move):
+        """Plays a move for the side to move, in place."""
+        p = self.points
+        side = self.turn
+        slot = move[0] + 1
+        count = p[slot]
+        h = self.zobrist ^ ZOBRIST[slot][count] ^ ZOBRIST[slot][count - side]
+        p[slot] = count - side
+        end = move[1]
+        if end == -1 or end == 24:
+            # Bearing off: the checker leaves the board.
+            if side == WHITE:
+                h ^= ZOBRIST_OFF_WHITE[self.off_white] ^ ZOBRIST_OFF_WHITE[self.off_white + 1]
+                self.off_white += 1
+            else:
+                h ^= ZOBRIST_OFF_BLACK[self.off_black] ^ ZOBRIST_OFF_BLACK[self.off_black + 1]
+                self.off_black += 1
+            self._hits.append(False)
+            self.zobrist = h
+            return
+        slot = end + 1
+        count = p[slot]
+        if count == -side:
+            # Hit a blot: send it to the opponent's bar.
+            bar = BLACK_BAR if side == WHITE else WHITE_BAR
+            h ^= ZOBRIST[bar][p[bar]] ^ ZOBRIST[bar][p[bar] - side]
+            p[bar] -= side
+            count = 0
+            self._hits.append(True)
+        else:
+            self._hits.append(False)
+        h ^= ZOBRIST[slot][p[slot]] ^ ZOBRIST[slot][count + side]
+        p[slot] = count + side
+        self.zobrist = h
+
+    def undo(self, move):
+        """Takes back the last move passed to apply(). Moves must be undone in reverse order."""
+        p = self.points
+        side = self.turn
+        hit = self._hits.pop()
+        h = self.zobrist
+        end = move[1]
+        if end == -1 or end == 24:
+            if side == WHITE:
+                h ^= ZOBRIST_OFF_WHITE[self.off_white] ^ ZOBRIST_OFF_WHITE[self.off_white - 1]
+                self.off_white -= 1
+            else:
+                h ^= ZOBRIST_OFF_BLACK[self.off_black] ^ ZOBRIST_OFF_BLACK[self.off_black - 1]
+                self.off_black -= 1
+        else:
+            slot = end + 1
+            count = p[slot] - side
+            if hit:
+                count = -side
+                bar = BLACK_BAR if side == WHITE else WHITE_BAR
+                h ^= ZOBRIST[bar][p[bar]] ^ ZOBRIST[bar][p[bar] + side]
+                p[bar] += side
+            h ^= ZOBRIST[slot][p[slot]] ^ ZOBRIST[slot][count]
+            p[slot] = count
+        slot = move[0] + 1
+        count = p[slot]
+        h ^= ZOBRIST[slot][count] ^ ZOBRIST[slot][count + side]
+        p[slot] = count + side
+        self.zobrist = h
+
+    def all_in_home(self):
+        """Return True if all checkers for the side to move are in their home board and not on the bar."""
+        p = self.points
+        if self.turn == WHITE:
+            if p[WHITE_BAR] > 0:
+                return False
+            for slot in range(1, 19):
+                if p[slot] > 0:
+                    return False
+        else:
+            if p[BLACK_BAR] < 0:
+                return False
+            for slot in range(7, 25):
+                if p[slot] < 0:
+                    return False
+        return True
+
+    def pips(self, side):
+        """Pip count for side: total distance its checkers still have to travel to bear off."""
+        p = self.points
+        if side == WHITE:
+            return sum(p[slot] * (25 - slot) for slot in range(0, 25) if p[slot] > 0)
+        return sum(-p[slot] * slot for slot in range(1, 26) if p[slot] < 0)
+
+    def winner(self):
+        """1 if White has no checkers left on the board, -1 for Black, otherwise False."""
+        p = self.points
+        if not any(p[slot] > 0 for slot in range(1, 25)):
+            return 1
+        if not any(p[slot] < 0 for slot in range(1, 25)):
+            return -1
+        return False
+
+    def moves(self, dice):
+        """
+        Returns the single-checker moves for the side to move using any value in dice.
+        See Backgammon.get_all_available_moves() for the rules; the output is identical.
+        """
+        p = self.points
+        moves = []
+        if self.turn == WHITE:
+            if p[WHITE_BAR] > 0:
+                # Re-entry onto points 0-5.
+                for end in range(0, 6):
+                    d = end + 1
+                    if d in dice and p[end + 1] >= -1:
+                        moves.append((-1, end, d, "re-entry"))
+                return moves
+            for start in range(24):
+                if p[start + 1] <= 0:
+                    continue
+                for d in dice:
+                    end = start + d
+                    if end < 24 and p[end + 1] >= -1:
+                        moves.append((start, end, d, "normal"))
+            if self.all_in_home():
+                # White home: indices 18-23, the furthest checker is the lowest index.
+                furthest = None
+                for start in range(18, 24):
+                    if p[start + 1] > 0:
+                        furthest = start
+                        break
+                for start in range(18, 24):
+                    if p[start + 1] <= 0:
+                        continue
+                    required = 24 - start
+                    if required in dice:
+                        moves.append((start, 24, required, "bear_off"))
+                    elif start == furthest:
+                        higher_options = [d for d in dice if d > required]
+                        if higher_options:
+                            moves.append((start, 24, min(higher_options), "bear_off"))
+        else:
+            if p[BLACK_BAR] < 0:
+                # Re-entry onto points 18-23.
+                for end in range(18, 24):
+                    d = 24 - end
+                    if d in dice and p[end + 1] <= 1:
+                        moves.append((24, end, d, "re-entry"))
+                return moves
+            for start in range(24):
+                if p[start + 1] >= 0:
+                    continue
+                for d in dice:
+                    end = start - d
+                    if end >= 0 and p[end + 1] <= 1:
+                        moves.append((start, end, d, "normal"))
+            if self.all_in_home():
+                # Black home: indices 0-5, the furthest checker is the highest index.
+                furthest = None
+                for start in range(5, -1, -1):
+                    if p[start + 1] < 0:
+                        furthest = start
+                        break
+                for start in range(0, 6):
+                    if p[start + 1] >= 0:
+                        continue
+                    required = start + 1
+                    if required in dice:
+                        moves.append((start, -1, required, "bear_off"))
+                    elif start == furthest:
+                        higher_options = [d for d in dice if d > required]
+                        if higher_options:
+                            moves.append((start, -1, min(higher_options), "bear_off"))
+        return moves
+
+
+def legal_plays(pos, dice):
+    """
+    Returns every distinct legal full play for the side to move as a list of
+    (moves, position) pairs, where moves is a tuple of move tuples and position
+    is a new Position with the play applied.
+
+    - As many dice as possible must be used.
+    - If only one die of a non-double roll can be used, it must be the larger one when possible.
+    - Plays that reach the same final position through a different move order are dropped,
+      keeping the first one found.
+    If nothing can be played, the single empty play ((), copy of pos) is returned.
+    pos is left unchanged.
+    """
+    dice = list(dice)
+    white = pos.turn == WHITE
+    # With doubles every move uses the same distance, so any play can be reordered to move the
+    # rearmost checkers first; only generating moves in that order avoids most permutations.
+    doubles = len(dice) > 1 and dice.count(dice[0]) == len(dice)
+    plays = {}
+    seq = []
+    best = [0, False]  # Longest play found so far, and whether that length was reached with the larger die.
+    high = max(dice) if dice else 0
+
+    def record():
+        n = len(seq)
+        if n < best[0]:
+            return
+        if n > best[0]:
+            best[0] = n
+            best[1] = False
+            plays.clear()
+        if n == 1 and not doubles and len(dice) == 2:
+            # Must play the larger die if either die alone could be played.
+            uses_high = seq[0][2] == high
+            if best[1] and not uses_high:
+                return
+            if uses_high and not best[1]:
+                best[1] = True
+                plays.clear()
+        key = pos.key()
+        if key not in plays:
+            plays[key] = (tuple(seq), pos.copy())
+
+    def walk(remaining, floor):
+        played = False
+        seen = set()
+        for move in pos.moves(remaining):
+            if move in seen:
+                continue  # Repeated dice values list the same move more than once.
+            seen.add(move)
+            order = 0
+            if doubles:
+                order = move[0] if white else 23 - move[0]
+                if order < floor:
+                    continue
+            played = True
+            pos.apply(move)
+            seq.append(move)
+            rest = remaining[:]
+            rest.remove(move[2])
+            walk(rest, order)
+            seq.pop()
+            pos.undo(move)
+        if not played:
+            record()
+
+    walk(dice, -1)
+    return list(plays.values())
@@ -1,6 +1,9 @@
+import logging
 import time
 import random
 
+log = logging.getLogger(__name__)
+
 def Rplay_ai_move(game, delay=1.0):
     """
     Executes AI moves for Black (current_player == -1) with a delay between moves.
@@ -33,12 +36,41 @@ def Rplay_ai_move(game, delay=1.0):
         # time.sleep(delay)
         
         # Execute the move via the existing make_move function.
+        version = game.version
         move_executed = game.make_move(start, end)
-        print("AI move executed:", chosen_move)
-        print("Updated board state:", game.get_board_state())
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("AI move executed", extra={"move": chosen_move, "state": game.get_board_state()})
         
-        # If no moves remain or no legal moves are possible, the turn will switch inside make_move.
-        if not game.moves_remaining or not game.can_make_any_move():
+        # Once the turn is over make_move rolls again (for Black too if White is blocked), so a
+        # version bump beyond the move itself means this turn has ended.
+        if game.version != version + 1:
             break
     
     return game.get_board_state()
+
+
+def random_turn(game):
+    """
+    Plays the rest of the current turn for whichever side is to move, one random
+    legal checker move at a time, without any output. Used for headless play.
+    Stops after one roll, even when the opponent is blocked and the same side rolls again.
+    
+    Args:
+        game: The Backgammon game instance.
+
+    Returns:
+        The number of checker moves played.
+    """
+    player = game.current_player
+    played = 0
+    while game.current_player == player and not game.game_over:
+        available_moves = game.get_all_available_moves()
+        if not available_moves:
+            break
+        start, end, dice_value, move_type = random.choice(available_moves)
+        version = game.version
+        game.make_move(start, end)
+        played += 1
+        if game.version != version + 1:
+            break  # The turn ended and the dice were rolled again.
+    return played
@@ -0,0 +1,271 @@
+# monte carlo rollout AI. scores every legal play by rolling the game forward with random
+# dice and random moves, within a wall-clock budget.
+import math
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from bearoff import race_equity
+from dice import ALL_ROLLS, RandomDice, ScriptedDice, stratified_rolls
+from position import Position
+from telemetry import record_decision
+
+# Rollouts stop after this many turns and score the position by pip count.
+MAX_TURNS = 12
+# Rollouts per task sent to a worker (or run inline between deadline checks).
+BATCH = 8
+# A candidate is dropped once the leader beats it by this many standard errors (about 99%).
+Z_PRUNE = 2.58
+# Candidates need this many rollouts before they can be pruned.
+MIN_ROLLOUTS = 16
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()  # Request threads may ask for the pool at the same time.
+
+
+def get_pool(workers):
+    """Returns the shared rollout process pool, (re)creating it for the requested size."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = ProcessPoolExecutor(max_workers=workers)
+            _pool_workers = workers
+        return _pool
+
+
+def pip_equity(pos, player):
+    """
+    Cheap equity estimate in [-1, 1] for player from the pip count race, or exact from the
+    bear-off database once both sides are bearing off.
+    """
+    race = race_equity(pos)
+    if race is not None:
+        return race if pos.turn == player else -race
+    lead = pos.pips(-player) - pos.pips(player)
+    return math.tanh(lead / 30.0)
+
+
+def rollout(pos, player, rng, max_turns=MAX_TURNS, dice=None):
+    """
+    Plays pos forward in place with random dice and random checker moves, starting with the side to
+    move, for at most max_turns turns. Returns the result for player: 1 win, -1 loss, or the pip
+    count estimate if the game did not finish. The rolls come from the dice source dice, or from rng
+    without one; checker moves are always picked with rng.
+    """
+    for _ in range(max_turns):
+        d1, d2 = dice.roll() if dice else (rng.randint(1, 6), rng.randint(1, 6))
+        remaining = [d1] * 4 if d1 == d2 else [d1, d2]
+        while remaining:
+            moves = pos.moves(remaining)
+            if not moves:
+                break
+            move = rng.choice(moves)
+            pos.apply(move)
+            remaining.remove(move[2])
+        winner = pos.winner()
+        if winner:
+            return 1.0 if winner == player else -1.0
+        pos.switch_turn()
+    return pip_equity(pos, player)
+
+
+def rollout_batch(key, player, seed, count, max_turns=MAX_TURNS, first_rolls=None):
+    """
+    Runs count rollouts from the position key (Position.key() with the opponent to move) and
+    returns their results for player. Runs in worker processes.
+
+    Every rollout rolls from its own dice stream drawn from seed, apart from the checker play, so
+    batches run with the same seed see the same dice whatever the position (common random numbers).
+    first_rolls optionally fixes the first roll of each rollout.
+    """
+    rng = random.Random(seed)
+    start = Position.from_key(key)
+    results = []
+    for i in range(count):
+        dice = RandomDice(rng.getrandbits(64))
+        if first_rolls:
+            dice = ScriptedDice([first_rolls[i]], then=dice)
+        results.append(rollout(start.copy(), player, random.Random(rng.getrandbits(64)), max_turns, dice))
+    return results
+
+
+class _Candidate:
+    __slots__ = ("moves", "key", "total", "squares", "n", "sent", "batches")
+
+    def __init__(self, moves, key):
+        self.moves = moves
+        self.key = key
+        self.total = 0.0
+        self.squares = 0.0
+        self.n = 0
+        self.sent = 0  # Batches handed out so far; the next one gets this index.
+        self.batches = {}  # batch index -> rollout results
+
+    def add(self, batch, results):
+        self.batches[batch] = results
+        self.total += sum(results)
+        self.squares += sum(r * r for r in results)
+        self.n += len(results)
+
+    def mean(self):
+        return self.total / self.n if self.n else 0.0
+
+    def variance(self):
+        if self.n < 2:
+            return 1.0
+        mean = self.total / self.n
+        return max(self.squares / self.n - mean * mean, 1e-9) * self.n / (self.n - 1)
+
+
+def _paired_lead(leader, c):
+    """
+    Mean and standard error of leader's lead over c, from the rollouts both ran with the same dice.
+    None if they share fewer than MIN_ROLLOUTS.
+    """
+    diffs = [a - b for k, results in c.batches.items() if k in leader.batches
+             for a, b in zip(leader.batches[k], results)]
+    m = len(diffs)
+    if m < MIN_ROLLOUTS:
+        return None
+    mean = sum(diffs) / m
+    variance = max(sum((d - mean) ** 2 for d in diffs) / (m - 1), 1e-9)
+    return mean, math.sqrt(variance / m)
+
+
+def _prune(alive, paired=False):
+    """
+    Drops candidates the leader beats by a significant margin. Returns the remaining ones.
+    With paired (common random numbers) the margin is tested on the per-rollout differences, whose
+    spread is much smaller than that of the two results on their own.
+    """
+    ready = [c for c in alive if c.n >= MIN_ROLLOUTS]
+    if len(ready) < 2:
+        return alive
+    leader = max(ready, key=_Candidate.mean)
+    lead_var = leader.variance() / leader.n
+    keep = []
+    for c in alive:
+        if c is leader or c.n < MIN_ROLLOUTS:
+            keep.append(c)
+            continue
+        if paired:
+            lead = _paired_lead(leader, c)
+            if lead is None or lead[0] <= Z_PRUNE * lead[1]:
+                keep.append(c)
+            continue
+        se = math.sqrt(lead_var + c.variance() / c.n)
+        if leader.mean() - c.mean() <= Z_PRUNE * se:
+            keep.append(c)
+    return keep
+
+
+def choose_play(game, budget=0.2, workers=0, seed=None, max_turns=MAX_TURNS, common=True, stratified=True):
+    """
+    Picks a full play for the side to move in game by rollouts.
+
+    Every legal play gets rollouts in rounds of BATCH until the budget (seconds) runs out or one play
+    leads all others significantly; plays that fall significantly behind stop receiving rollouts.
+    With workers > 0 the rollouts run on a shared process pool, otherwise inline.
+
+    Two variance reductions are on by default. With common, the k-th batch of every play rolls the
+    same dice, so plays are compared on equal luck and pruned on their paired differences. With
+    stratified, the opponent's first roll cycles through all 36 rolls in a shuffled order instead
+    of being drawn at random.
+
+    Returns (moves, info) where moves is the chosen tuple of moves (empty if there is nothing to
+    play) and info holds search statistics.
+    """
+    t0 = time.perf_counter()
+    deadline = t0 + budget
+    player = game.current_player
+    plays = game.get_all_plays()
+    info = {"candidates": len(plays), "rollouts": 0, "early_stop": False, "seconds": 0.0}
+    if len(plays) == 1:
+        info["seconds"] = time.perf_counter() - t0
+        record_decision("rollout", info["seconds"], 0)
+        return plays[0][0], info
+
+    candidates = []
+    for moves, pos in plays:
+        pos.switch_turn()
+        candidates.append(_Candidate(moves, pos.key()))
+    alive = candidates
+    rng = random.Random(seed)
+    base_seed = rng.getrandbits(64)
+    order = rng.sample(ALL_ROLLS, len(ALL_ROLLS))
+
+    def batch_args(c):
+        k = c.sent
+        c.sent += 1
+        batch_seed = (base_seed + k * 0x9E3779B97F4A7C15) & (2 ** 64 - 1) if common else rng.getrandbits(64)
+        first_rolls = stratified_rolls(BATCH, k * BATCH, order) if stratified else None
+        return k, (c.key, player, batch_seed, BATCH, max_turns, first_rolls)
+
+    if workers:
+        pool = get_pool(workers)
+        pending = {}
+        while True:
+            if len(alive) == 1:
+                info["early_stop"] = True
+                break
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            # Keep every worker busy, topping up the candidates with the fewest rollouts first.
+            while len(pending) < 2 * workers:
+                c = min(alive, key=lambda c: c.sent)
+                k, args = batch_args(c)
+                pending[pool.submit(rollout_batch, *args)] = (c, k)
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                c, k = pending.pop(future)
+                c.add(k, future.result())
+                info["rollouts"] += BATCH
+            alive = _prune(alive, common)
+            for future in [f for f, (c, _) in pending.items() if c not in alive]:
+                future.cancel()
+                del pending[future]
+        for future in pending:
+            future.cancel()
+    else:
+        while time.perf_counter() < deadline:
+            if len(alive) == 1:
+                info["early_stop"] = True
+                break
+            for c in alive:
+                k, args = batch_args(c)
+                c.add(k, rollout_batch(*args))
+                info["rollouts"] += BATCH
+                if time.perf_counter() >= deadline:
+                    break
+            alive = _prune(alive, common)
+
+    best = max([c for c in alive if c.n] or alive, key=_Candidate.mean)
+    info["equity"] = best.mean()
+    info["seconds"] = time.perf_counter() - t0
+    record_decision("rollout", info["seconds"], info["rollouts"])
+    return best.moves, info
+
+
+def Rollout_ai_move(game, budget=0.2, workers=0):
+    """
+    Plays Black's turn (current_player == -1) with the play chosen by choose_play.
+
+    Args:
+        game: The Backgammon game instance.
+        budget: Thinking time in seconds.
+        workers: Rollout worker processes (0 runs the rollouts in this process).
+
+    Returns:
+        The updated board state as a dictionary.
+    """
+    if game.current_player != -1 or game.game_over:
+        return game.get_board_state()
+    moves, _ = choose_play(game, budget, workers)
+    for start, end, _, _ in moves:
+        game.make_move(start, end)
+    return game.get_board_state()
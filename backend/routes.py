@@ -1,54 +1,213 @@
 # API endpoints. handles API logic for user actions, game setting...
+import logging
+import math
 import random
-from flask import Blueprint, request, jsonify
-from game import Backgammon
+import threading
+import time
+from functools import wraps
+from flask import Blueprint, Response, g, request, jsonify
 import json
-from random_ai import Rplay_ai_move  # Ensure this is imported
+from rollout_ai import Rollout_ai_move
+from neural_ai import Neural_ai_move, default_network
+from opening_book import book_play
+import config
+from dice import RandomDice
+from game import Backgammon
+from sessions import GameRegistry
+from models import GameStore
+from jobs import JobManager, QueueFull
+import sockets
+import telemetry
 
 # from app import app
 
 
 # Create a Blueprint instead of directly using `app`
 game_routes = Blueprint("game_routes", __name__)
-# Create a game instance
-game = Backgammon()
+log = logging.getLogger(__name__)
+# Live games, keyed by the game_id returned from /api/game/start
+games = GameRegistry(max_games=config.MAX_LIVE_GAMES, ttl=config.GAME_TTL)
+# Event log games are recorded in, and reloaded from once evicted or after a restart
+store = GameStore(config.DATABASE_PATH, config.STORE_BATCH, config.STORE_INTERVAL,
+                  config.SNAPSHOT_EVERY) if config.PERSIST_GAMES else None
+
+
+def find_session(game_id):
+    """The live session of game_id, reloading the game from the store if needed; None if unknown."""
+    session = games.get(game_id)
+    if session is None and store is not None and game_id:
+        game = store.load(game_id)
+        if game is not None:
+            session = games.add(game_id, game)
+    return session
+
+
+def _job_finished(job, session):
+    """Pushes the board change and the job result of a finished AI move job."""
+    if session is not None:
+        sockets.publish(session)
+    sockets.job_finished(job)
+
+
+# AI move jobs, computed on worker processes
+jobs = JobManager(find_session, _job_finished, workers=config.AI_JOB_WORKERS,
+                  max_queued=config.AI_JOB_QUEUE_LIMIT, player=config.AI_PLAYER,
+                  book=config.USE_OPENING_BOOK)
+
+
+@game_routes.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+    g.profiler = None
+    if config.PROFILING_ENABLED and request.args.get('profile'):
+        g.profiler = telemetry.SamplingProfiler(threading.get_ident(), config.PROFILE_INTERVAL).start()
+
+
+@game_routes.after_request
+def note_status(response):
+    g.response_status = response.status_code
+    return response
+
+
+@game_routes.teardown_request
+def record_request(exc):
+    """
+    Records request latency and status per endpoint, and writes the profile of a profiled request.
+    Runs as a teardown so requests whose view raised are counted (as 500s) and stop their profiler.
+    """
+    if 'request_start' not in g:
+        return
+    endpoint = request.endpoint or "unknown"
+    telemetry.HTTP_LATENCY.observe(time.perf_counter() - g.request_start, endpoint)
+    telemetry.HTTP_REQUESTS.inc(1, endpoint, 500 if exc is not None else g.get('response_status', 500))
+    if g.get('profiler') is not None:
+        g.profiler.stop()
+        try:
+            path = telemetry.profile_path(config.PROFILE_DIR, endpoint.replace(".", "-"))
+            g.profiler.write(path)
+        except OSError:
+            log.exception("could not write request profile")
+        else:
+            log.info("request profiled", extra={"endpoint": endpoint, "profile": path,
+                                                 "samples": sum(g.profiler.stacks.values())})
+
+
+@game_routes.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Counters and latency histograms in the Prometheus text format."""
+    return Response(telemetry.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
+def with_game(view):
+    """
+    Looks up the game named by the game_id query parameter or JSON field and calls
+    view(game) while holding that game's lock (with g.game_id set), then pushes any
+    change to the game's websocket room. Unknown or evicted games get a 404.
+    """
+    @wraps(view)
+    def wrapper():
+        game_id = request.args.get('game_id') or (request.get_json(silent=True) or {}).get('game_id')
+        session = find_session(game_id)
+        if session is None:
+            return jsonify({"error": "Unknown game"}), 404
+        g.game_id = session.game_id
+        g.session = session
+        with session.lock:
+            version = session.game.version
+            response = view(session.game)
+            if session.game.version != version:
+                sockets.publish(session)
+            return response
+    return wrapper
+
+
+def state_response(session, compact=False):
+    """
+    The state of session's game (call with the session lock held) as a JSON response tagged with
+    the game version. A client whose If-None-Match holds that tag gets an empty 304 instead. The
+    serialized body is kept until the game changes, so polling an unchanged game costs a dict
+    lookup. compact sends Backgammon.get_compact_state() instead of the full state.
+    """
+    game = session.game
+    fmt = "compact" if compact else "full"
+    cached = session.responses.get(fmt)
+    if cached is None or cached[0] != game.version:
+        state = game.get_compact_state() if compact else game.get_board_state()
+        state["version"] = game.version
+        cached = session.responses[fmt] = (game.version, json.dumps(state, separators=(",", ":")))
+    response = Response(cached[1], mimetype="application/json")
+    response.set_etag("%s-%d%s" % (session.epoch, game.version, "c" if compact else ""))
+    # Let browsers keep the body but revalidate it on every poll.
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
 
 @game_routes.route('/api/game/start', methods=['POST'])
 def start_game():
-    global game
-    game = Backgammon()
-    game.current_player = random.choice([1, -1])
+    """
+    Starts a new game and returns its state with the game_id to use in every other request.
+    Each game rolls from its own random generator; an integer "seed" makes the starting side and
+    every roll of the game repeatable.
+    """
+    data = request.get_json(silent=True) or {}
+    seed = data.get('seed')
+    if seed is not None and (not isinstance(seed, int) or isinstance(seed, bool)):
+        return jsonify({"error": "Invalid 'seed' parameter"}), 400
+    previous = data.get('game_id')
+    if previous:
+        jobs.cancel_game(previous)
+        games.remove(previous)
+    rng = random.Random(seed)
+    # 63 bits, so the game's dice seed fits the INTEGER column it is stored in.
+    session = games.create(Backgammon(dice=RandomDice(rng.getrandbits(63))))
+    game = session.game
+    if store is not None:
+        store.new_game(session.game_id, game)
+    game.current_player = rng.choice([1, -1])
     game.roll_dice()  # Roll dice to update dice and moves_remaining.
-    return jsonify(game.get_board_state())
+    game.pass_blocked_turns()
+    state = game.get_board_state()
+    state["game_id"] = session.game_id
+    return jsonify(state)
 
 
 @game_routes.route('/api/game/roll-dice', methods=['GET'])
-def roll_dice():
-    dice = game.roll_dice()  # This method should also set game.moves_remaining appropriately
-    print("dice", dice, "moves remaining:", game.moves_remaining)
+@with_game
+def roll_dice(game):
+    game.roll_dice()  # This method should also set game.moves_remaining appropriately
+    game.pass_blocked_turns()
+    dice = game.dice
+    log.debug("dice rolled", extra={"dice": dice, "moves_remaining": game.moves_remaining})
     return jsonify({"dice": dice, "moves_remaining": game.moves_remaining})
 
 
 @game_routes.route('/api/game/move', methods=['POST'])
-def move():
+@with_game
+def move(game):
     """Processes a player's move."""
     data = request.json
     start = data.get('start')
     end = data.get('end')
 
     if game.make_move(start, end):
-        print("current board state:", game.get_board_state())
-        return jsonify(game.get_board_state())
+        log.debug("move played", extra={"game_id": g.game_id, "start": start, "end": end,
+                                        "version": game.version})
+        return state_response(g.session)
     else:
         return jsonify({"error": "Invalid move"}), 400
 
 @game_routes.route('/api/game/state', methods=['GET'])
-def get_state():
-    """Returns the current game state."""
-    return jsonify(game.get_board_state())
+@with_game
+def get_state(game):
+    """
+    Returns the current game state, or 304 when If-None-Match holds its current ETag.
+    With ?format=compact only the position ID, dice and turn are sent.
+    """
+    return state_response(g.session, compact=request.args.get('format') == 'compact')
 
 @game_routes.route('/api/game/valid-moves', methods=['POST'])
-def valid_moves():
+@with_game
+def valid_moves(game):
     """Returns a list of valid destination indices for the selected checker."""
     data = request.json
     start = data.get('start')
@@ -59,16 +218,83 @@ def valid_moves():
 
 
 @game_routes.route('/api/game/ai-move', methods=['POST'])
-def ai_move():
+@with_game
+def ai_move(game):
     """
     Processes an AI move for Black.
-    It verifies that it’s Black’s turn, then calls play_ai_move
-    (which selects a random move with delays) and returns the updated game state.
+    It verifies that it’s Black’s turn, then plays the opening book move if there is one, or
+    calls Neural_ai_move (the play the trained network rates best) or, with
+    config.AI_PLAYER = "rollout" or no trained network, Rollout_ai_move (the best rollout
+    equity within config.AI_MOVE_BUDGET), and returns the updated game state.
     """
     # Check that it's AI's turn (Black)
     if game.current_player != -1:
         return jsonify({"error": "Not AI's turn"}), 400
 
-    # Call the AI function with a delay of 1 second (or adjust as needed)
-    new_state = Rplay_ai_move(game, delay=1.0)
+    moves = book_play(game) if config.USE_OPENING_BOOK and not game.game_over else None
+    if moves is not None:
+        for start, end in moves:
+            game.make_move(start, end)
+        new_state = game.get_board_state()
+    elif config.AI_PLAYER == "neural" and default_network() is not None:
+        new_state = Neural_ai_move(game)
+    else:
+        new_state = Rollout_ai_move(game, budget=config.AI_MOVE_BUDGET, workers=config.AI_ROLLOUT_WORKERS)
     return jsonify(new_state)
+
+
+@game_routes.route('/api/game/ai-move/jobs', methods=['POST'])
+@with_game
+def submit_ai_move(game):
+    """
+    Starts computing Black's move in the background and returns the job (202).
+    The optional "budget" (seconds, above zero) is capped at config.AI_JOB_MAX_BUDGET. The result
+    is available from GET /api/game/ai-move/jobs/<job_id> and pushed to the game's
+    websocket room as an "ai_job" message. Answers 503 while too many jobs are queued.
+    """
+    if game.current_player != -1 or game.game_over:
+        return jsonify({"error": "Not AI's turn"}), 400
+    data = request.get_json(silent=True) or {}
+    try:
+        budget = float(data.get('budget', config.AI_MOVE_BUDGET))
+    except (TypeError, ValueError):
+        budget = math.nan
+    if not math.isfinite(budget) or budget <= 0:
+        return jsonify({"error": "Invalid 'budget' parameter"}), 400
+    budget = min(budget, config.AI_JOB_MAX_BUDGET)
+    try:
+        job = jobs.submit(g.game_id, game, budget)
+    except QueueFull:
+        return jsonify({"error": "Too many AI moves in progress"}), 503, {"Retry-After": "1"}
+    return jsonify(job.to_dict()), 202
+
+
+@game_routes.route('/api/game/ai-move/jobs/<job_id>', methods=['GET'])
+def ai_move_job(job_id):
+    """Returns the status of an AI move job, with the new game state once it is done."""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job.to_dict())
+
+
+@game_routes.route('/api/game/ai-move/jobs/<job_id>', methods=['DELETE'])
+def cancel_ai_move_job(job_id):
+    """Cancels an AI move job; its move is not played."""
+    job = jobs.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job.to_dict())
+
+
+@game_routes.route('/api/game/resign', methods=['POST'])
+@with_game
+def resign(game):
+    """Resigns the game for "player" (default 1, White): cancels any AI move job and ends the game."""
+    player = (request.get_json(silent=True) or {}).get('player', 1)
+    if player not in (1, -1):
+        return jsonify({"error": "Invalid 'player' parameter"}), 400
+    jobs.cancel_game(g.game_id)
+    if not game.game_over:
+        game.resign(player)
+    return state_response(g.session)
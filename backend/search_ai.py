@@ -0,0 +1,344 @@
+# expectiminimax search AI. searches plays and dice rolls with star1/star2 pruning, a zobrist
+# transposition table and iterative deepening to a time limit.
+import math
+import time
+
+import random
+
+from bearoff import race_equity
+from position import ROLLS, WHITE, legal_plays
+from telemetry import record_decision
+
+# Values are equities in [LOW, HIGH] for the side to move (gammons are not counted).
+LOW = -1.0
+HIGH = 1.0
+
+# Per-roll keys mixed into the position hash for decision nodes (position + known roll),
+# for every multiset of 1-4 dice that can be left to play.
+_roll_rng = random.Random(0x7E57)
+ROLL_KEYS = {}
+for _d1 in range(1, 7):
+    for _d2 in range(_d1, 7):
+        for _dice in ((_d1,), (_d1, _d2), (_d1,) * 3, (_d1,) * 4):
+            ROLL_KEYS.setdefault(_dice, _roll_rng.getrandbits(64))
+# Entries kept in the per-search caches of generated plays and static evaluations, so Star2
+# probes and the searches that follow generate and evaluate each node once.
+CACHE_SIZE = 100000
+
+# Transposition table entry bounds.
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+class SearchTimeout(Exception):
+    """Raised inside the search when the time limit is reached."""
+
+
+class TranspositionTable:
+    """
+    Fixed-size hash table of search results, indexed by the low bits of the Zobrist key.
+
+    Each slot holds one entry (key, depth, bound, value, best, generation). A new entry replaces
+    the stored one if it comes from a newer search (generation) or was searched at least as deep.
+    """
+
+    def __init__(self, bits=18):
+        self.size = 1 << bits
+        self.mask = self.size - 1
+        self.entries = [None] * self.size
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.replacements = 0
+
+    def new_search(self):
+        self.generation += 1
+
+    def probe(self, key):
+        self.probes += 1
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        return None
+
+    def store(self, key, depth, bound, value, best=0):
+        index = key & self.mask
+        old = self.entries[index]
+        if old is not None:
+            if old[5] == self.generation and old[1] > depth:
+                return
+            if old[0] != key:
+                self.replacements += 1
+        self.entries[index] = (key, depth, bound, value, best, self.generation)
+        self.stores += 1
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+
+def heuristic_eval(pos):
+    """
+    Static equity estimate in [-1, 1] for the side to move: pip count race, blots,
+    checkers on the bar and home board points. Bear-off races are looked up in the bear-off
+    database instead.
+    """
+    side = pos.turn
+    winner = pos.winner()
+    if winner:
+        return HIGH if winner == side else LOW
+    race = race_equity(pos)
+    if race is not None:
+        return race
+    p = pos.points
+    score = (pos.pips(-side) - pos.pips(side)) / 30.0
+    for slot in range(1, 25):
+        count = p[slot] * side
+        if count == 1:
+            score -= 0.06
+        elif count == -1:
+            score += 0.06
+    # Home boards: slots 19-24 for White, 1-6 for Black.
+    own_home, opp_home = (range(19, 25), range(1, 7)) if side == WHITE else (range(1, 7), range(19, 25))
+    for slot in own_home:
+        if p[slot] * side >= 2:
+            score += 0.05
+    for slot in opp_home:
+        if p[slot] * side <= -2:
+            score -= 0.05
+    own_bar, opp_bar = (0, 25) if side == WHITE else (25, 0)
+    score += 0.15 * (abs(p[opp_bar]) - abs(p[own_bar]))
+    return math.tanh(score)
+
+
+class ExpectiminimaxSearch:
+    """
+    Expectiminimax over plays and dice, valued for the side to move.
+
+    Depth counts decisions: depth 1 picks the play with the best static evaluation, depth 2 also
+    averages over the opponent's 21 replies to each play, and so on. Chance nodes use Star1
+    (bounds from the children searched so far) and Star2 (probing one play per roll first) to cut
+    off, and all nodes go through the transposition table.
+    """
+
+    def __init__(self, evaluate=heuristic_eval, tt_bits=18):
+        self.evaluate = evaluate
+        self.tt = TranspositionTable(tt_bits)
+        self.deadline = None
+        self._plays = {}
+        self._values = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.nodes = 0
+        self.evals = 0
+        self.star1_cutoffs = 0
+        self.star2_cutoffs = 0
+        self.beta_cutoffs = 0
+
+    def _check_time(self):
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+
+    def _children(self, pos, dice, key):
+        """Legal plays for pos and dice as (moves, position with the opponent to move) pairs."""
+        children = self._plays.get(key)
+        if children is None:
+            self._check_time()
+            children = []
+            for moves, child in legal_plays(pos, dice):
+                child.switch_turn()
+                children.append((moves, child))
+            if len(self._plays) >= CACHE_SIZE:
+                self._plays.clear()
+            self._plays[key] = children
+        return children
+
+    def _static(self, child):
+        """Static value of a play's resulting position for the side that played it."""
+        value = self._values.get(child.zobrist)
+        if value is None:
+            self.evals += 1
+            value = -self.evaluate(child)
+            if len(self._values) >= CACHE_SIZE:
+                self._values.clear()
+            self._values[child.zobrist] = value
+        return value
+
+    def decision(self, pos, dice, depth, alpha, beta, root=False):
+        """
+        Value of pos for the side to move with dice already rolled. Returns (value, best play); the
+        play is None when the transposition table answers, except at the root, which always searches.
+        """
+        self.nodes += 1
+        self._check_time()
+        key = pos.zobrist ^ ROLL_KEYS[dice]
+        entry = self.tt.probe(key)
+        best_index = 0
+        if entry is not None:
+            best_index = entry[4]
+            if entry[1] >= depth and not root:
+                bound, value = entry[2], entry[3]
+                if bound == EXACT or (bound == LOWER and value >= beta) or (bound == UPPER and value <= alpha):
+                    return value, None
+
+        children = self._children(pos, dice, key)
+        alpha0 = alpha
+        best = LOW - 1.0
+        best_moves = None
+        if depth == 1:
+            # Leaf decisions: stop at the first play that already reaches beta.
+            for i, (moves, child) in enumerate(children):
+                value = self._static(child)
+                if value > best:
+                    best, best_moves, best_index = value, moves, i
+                    if best >= beta:
+                        self.beta_cutoffs += 1
+                        self.tt.store(key, depth, LOWER, best, best_index)
+                        return best, best_moves
+            self.tt.store(key, depth, EXACT, best, best_index)
+            return best, best_moves
+
+        # Best static evaluation first, with the best play of an earlier search in front.
+        order = sorted(range(len(children)), key=lambda i: self._static(children[i][1]), reverse=True)
+        if 0 < best_index < len(children):
+            order.remove(best_index)
+            order.insert(0, best_index)
+        for i in order:
+            moves, child = children[i]
+            value = -self.chance(child, depth - 1, -beta, -alpha)
+            if value > best:
+                best, best_moves, best_index = value, moves, i
+                if value > alpha:
+                    alpha = value
+                    if alpha >= beta:
+                        self.beta_cutoffs += 1
+                        break
+        bound = LOWER if best >= beta else UPPER if best <= alpha0 else EXACT
+        self.tt.store(key, depth, bound, best, best_index)
+        return best, best_moves
+
+    def _probe(self, pos, dice, depth):
+        """Star2 probe: value of a single play, a lower bound on the decision value."""
+        key = pos.zobrist ^ ROLL_KEYS[dice]
+        children = self._children(pos, dice, key)
+        entry = self.tt.probe(key)
+        index = entry[4] if entry is not None and entry[4] < len(children) else 0
+        child = children[index][1]
+        if depth == 1:
+            return self._static(child)
+        return -self.chance(child, depth - 1, -HIGH, -LOW)
+
+    def chance(self, pos, depth, alpha, beta):
+        """Expected value of pos for the side about to roll, over all 21 rolls."""
+        self.nodes += 1
+        winner = pos.winner()
+        if winner:
+            # The previous play ended the game.
+            return HIGH if winner == pos.turn else LOW
+        key = pos.zobrist
+        entry = self.tt.probe(key)
+        if entry is not None and entry[1] >= depth:
+            bound, value = entry[2], entry[3]
+            if bound == EXACT or (bound == LOWER and value >= beta) or (bound == UPPER and value <= alpha):
+                return value
+
+        # Star2: probe one play per roll for lower bounds on each child.
+        lows = [LOW] * len(ROLLS)
+        lower = LOW
+        for i, (dice, p) in enumerate(ROLLS):
+            lows[i] = self._probe(pos, dice, depth)
+            lower += p * (lows[i] - LOW)
+            if lower >= beta:
+                self.star2_cutoffs += 1
+                self.tt.store(key, depth, LOWER, lower)
+                return lower
+
+        # Star1: search every roll with a window narrowed by the bounds of the others.
+        done = 0.0  # Probability-weighted sum of child values searched so far.
+        rest_low = sum(p * low for (_, p), low in zip(ROLLS, lows))
+        rest_high = HIGH
+        for i, (dice, p) in enumerate(ROLLS):
+            rest_low -= p * lows[i]
+            rest_high -= p * HIGH
+            a = (alpha - done - rest_high) / p
+            b = (beta - done - rest_low) / p
+            value, _ = self.decision(pos, dice, depth, max(a, LOW), min(b, HIGH))
+            done += p * value
+            if value >= b:
+                self.star1_cutoffs += 1
+                self.tt.store(key, depth, LOWER, done + rest_low)
+                return done + rest_low
+            if value <= a:
+                self.star1_cutoffs += 1
+                self.tt.store(key, depth, UPPER, done + rest_high)
+                return done + rest_high
+        self.tt.store(key, depth, EXACT, done)
+        return done
+
+    def search(self, pos, dice, time_limit=1.0, max_depth=4):
+        """
+        Iterative deepening from depth 1 until time_limit seconds pass or max_depth is done.
+        Returns (moves, info): the best play of the deepest completed iteration and statistics.
+        """
+        t0 = time.perf_counter()
+        self.tt.new_search()
+        self.reset_stats()
+        dice = tuple(sorted(dice))
+        children = self._children(pos, dice, pos.zobrist ^ ROLL_KEYS[dice])
+        best_moves, best = max(children, key=lambda c: self._static(c[1]))
+        best_value, depth_done = self._static(best), 1
+        self.deadline = t0 + time_limit
+        if len(children) > 1:
+            # A forced play needs no search.
+            for depth in range(2, max_depth + 1):
+                try:
+                    best_value, best_moves = self.decision(pos, dice, depth, LOW, HIGH, root=True)
+                except SearchTimeout:
+                    break
+                depth_done = depth
+        self.deadline = None
+        self._plays.clear()
+        self._values.clear()
+        elapsed = time.perf_counter() - t0
+        info = {
+            "depth": depth_done,
+            "value": best_value,
+            "nodes": self.nodes,
+            "evals": self.evals,
+            "seconds": elapsed,
+            "nodes_per_second": self.nodes / elapsed if elapsed else 0.0,
+            "tt_hit_rate": self.tt.hit_rate(),
+            "tt_replacements": self.tt.replacements,
+            "star1_cutoffs": self.star1_cutoffs,
+            "star2_cutoffs": self.star2_cutoffs,
+            "beta_cutoffs": self.beta_cutoffs,
+        }
+        return best_moves, info
+
+
+def choose_play(game, time_limit=1.0, max_depth=4, searcher=None):
+    """Searches the position of game for the side to move with game.moves_remaining as the roll."""
+    searcher = searcher or ExpectiminimaxSearch()
+    moves, info = searcher.search(game.pos.copy(), game.moves_remaining, time_limit, max_depth)
+    record_decision("search", info["seconds"], info["nodes"])
+    return moves, info
+
+
+def Search_ai_move(game, time_limit=1.0):
+    """
+    Plays Black's turn (current_player == -1) with the play found by expectiminimax search.
+
+    Args:
+        game: The Backgammon game instance.
+        time_limit: Search time in seconds.
+
+    Returns:
+        The updated board state as a dictionary.
+    """
+    if game.current_player != -1 or game.game_over:
+        return game.get_board_state()
+    moves, _ = choose_play(game, time_limit)
+    for start, end, _, _ in moves:
+        game.make_move(start, end)
+    return game.get_board_state()
@@ -0,0 +1,97 @@
+# live game sessions. every game has an id and its own lock; idle games are evicted by LRU and TTL.
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from game import Backgammon
+
+
+class GameSession:
+    """
+    One live game: the Backgammon instance, the lock guarding it and when it was last used, plus
+    the sequence number and last pushed snapshot of its websocket updates (see sockets.py) and
+    the serialized state responses of the current game version (see routes.state_response).
+    """
+
+    __slots__ = ("game_id", "game", "lock", "last_used", "seq", "snapshot", "epoch", "responses")
+
+    def __init__(self, game_id, game):
+        self.game_id = game_id
+        self.game = game
+        # Reentrant: a job finishing right away applies its play under the submitting request's lock.
+        self.lock = threading.RLock()
+        self.last_used = time.monotonic()
+        self.seq = 0
+        self.snapshot = None
+        # ETags are epoch-version: a game reloaded from the database starts counting versions
+        # again, so it gets a new epoch and old ETags never match it.
+        self.epoch = secrets.token_hex(4)
+        self.responses = {}  # format -> (game version, JSON body)
+
+
+class GameRegistry:
+    """
+    Live games keyed by game id.
+
+    Sessions are kept in least-recently-used order. Creating a game beyond max_games evicts the
+    least recently used one, and games idle for more than ttl seconds are dropped whenever the
+    registry is used. The registry lock is only held for dictionary operations; moves lock the
+    session, so games never wait for each other.
+    """
+
+    def __init__(self, max_games=10000, ttl=3600.0):
+        self.max_games = max_games
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _expire(self, now):
+        sessions = self._sessions
+        while sessions:
+            session = next(iter(sessions.values()))
+            if now - session.last_used <= self.ttl:
+                break
+            sessions.popitem(last=False)
+            self.evicted += 1
+
+    def create(self, game=None):
+        """Registers a new game (a fresh Backgammon by default) and returns its session."""
+        return self.add(secrets.token_urlsafe(12), game or Backgammon())
+
+    def add(self, game_id, game):
+        """
+        Registers game under game_id (e.g. a game reloaded from the database) and returns its
+        session. If game_id is already live, the live session wins and is returned.
+        """
+        session = GameSession(game_id, game)
+        with self._lock:
+            self._expire(session.last_used)
+            live = self._sessions.get(game_id)
+            if live is not None:
+                return live
+            while len(self._sessions) >= self.max_games:
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+            self._sessions[game_id] = session
+        return session
+
+    def get(self, game_id):
+        """The session of game_id, marked as just used, or None if it is unknown or was evicted."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(game_id)
+            if session is not None:
+                session.last_used = now
+                self._sessions.move_to_end(game_id)
+        return session
+
+    def remove(self, game_id):
+        """Drops a game. Returns its session, or None if it was not live."""
+        with self._lock:
+            return self._sessions.pop(game_id, None)
@@ -1 +1,120 @@
 # websocket logic (realtime gameplay). manages realtime communication for multiplayer backgammon
+#
+# Clients join a game's room with {"game_id": ...} and get a full "state" message. After that every
+# change to the game is pushed as a small "delta" message holding only what changed:
+#   {"seq": 7, "points": [[5, -4], [9, 1]], "bar": [0, 1], "dice": [3, 5], "moves_remaining": [5]}
+# Possible keys besides seq: points ([board index, count] pairs), bar and off ([white, black]),
+# dice, moves_remaining, current_player, game_over, all_in_home and bear_offs (the legal bear-off
+# moves as [start, end] pairs, empty until the side to move has all checkers home). The full
+# move list is left out of deltas: it changes with nearly every move and would make each delta
+# larger than a full state. seq goes up by one per message; a client that sees a gap sends
+# "resync" and gets a full "state" again.
+from flask_socketio import emit, join_room, leave_room
+
+_socketio = None
+_find_session = None
+
+
+def snapshot(game):
+    """The parts of a game that deltas are made of."""
+    return {
+        "points": game.pos.board,
+        "bar": [game.bar_white, game.bar_black],
+        "off": [game.borne_off_white, game.borne_off_black],
+        "dice": list(game.dice),
+        "moves_remaining": list(game.moves_remaining),
+        "current_player": game.current_player,
+        "game_over": game.game_over,
+        "all_in_home": game.all_in_home(),
+        "bear_offs": _bear_offs(game),
+    }
+
+
+def _bear_offs(game):
+    """Legal bear-off moves of the side to move as [start, end] pairs; [] unless all are home."""
+    if not game.all_in_home():
+        return []
+    return [[start, end] for start, end, _, kind in game.get_all_available_moves() if kind == "bear_off"]
+
+
+def diff(old, new):
+    """Delta message fields turning snapshot old into new."""
+    delta = {}
+    points = [[i, n] for i, (o, n) in enumerate(zip(old["points"], new["points"])) if o != n]
+    if points:
+        delta["points"] = points
+    for key, value in new.items():
+        if key != "points" and old[key] != value:
+            delta[key] = value
+    return delta
+
+
+def publish(session):
+    """
+    Pushes what changed in session's game since the last push to the game's room. Call with the
+    session lock held, after anything that may have changed the game.
+    """
+    new = snapshot(session.game)
+    old, session.snapshot = session.snapshot, new
+    if old is None:
+        # Nobody can have joined yet: joining starts from a full state.
+        return
+    delta = diff(old, new)
+    if not delta:
+        return
+    session.seq += 1
+    delta["seq"] = session.seq
+    if _socketio is not None:
+        _socketio.emit("delta", delta, to=session.game_id)
+
+
+def job_finished(job):
+    """Tells a game's room that its AI move job is done, failed or was cancelled."""
+    if _socketio is not None:
+        _socketio.emit("ai_job", job.to_dict(state=False), to=job.game_id)
+
+
+def _full_state(session):
+    """Full "state" message for session's game, numbered like the deltas."""
+    if session.snapshot is None:
+        session.snapshot = snapshot(session.game)
+    state = session.game.get_board_state()
+    state["bear_offs"] = session.snapshot["bear_offs"]
+    state["game_id"] = session.game_id
+    state["seq"] = session.seq
+    return state
+
+
+def on_join(data):
+    session = _find_session((data or {}).get("game_id"))
+    if session is None:
+        emit("error", {"error": "Unknown game"})
+        return
+    join_room(session.game_id)
+    with session.lock:
+        emit("state", _full_state(session))
+
+
+def on_resync(data):
+    session = _find_session((data or {}).get("game_id"))
+    if session is None:
+        emit("error", {"error": "Unknown game"})
+        return
+    with session.lock:
+        emit("state", _full_state(session))
+
+
+def on_leave(data):
+    game_id = (data or {}).get("game_id")
+    if game_id:
+        leave_room(game_id)
+
+
+def init_socketio(socketio, find_session):
+    """Registers the game room handlers on socketio; find_session(game_id) looks up live games."""
+    global _socketio, _find_session
+    _socketio = socketio
+    _find_session = find_session
+    socketio.on_event("join", on_join)
+    socketio.on_event("resync", on_resync)
+    socketio.on_event("leave", on_leave)
@@ -0,0 +1,197 @@
+# observability: counters and histograms rendered in the prometheus text format, structured (json)
+# log output and a sampling profiler that can be switched on for single requests.
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+
+# Default histogram buckets (seconds), from 100 microseconds to 10 seconds.
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    """Monotonic counter, one value per label combination."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+
+    def inc(self, amount=1, *label_values):
+        # No lock: counters sit on hot paths, and a rare lost update under thread switches is
+        # an acceptable error for a metric.
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        for label_values, value in list(self._values.items()):
+            yield self.name, label_values, (), value
+
+
+class Histogram:
+    """Cumulative-bucket histogram (with sum and count), one per label combination."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            data = self._values.get(label_values)
+            if data is None:
+                data = self._values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+                    break
+            else:
+                data[len(self.buckets)] += 1
+            data[-1] += value
+
+    def samples(self):
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        for label_values, data in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), data):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield self.name + "_bucket", label_values, (("le", le),), cumulative
+            yield self.name + "_sum", label_values, (), data[-1]
+            yield self.name + "_count", label_values, (), cumulative
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help, labels=()):
+        metric = Counter(name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.append("# HELP %s %s" % (metric.name, metric.help))
+            lines.append("# TYPE %s %s" % (metric.name, metric.kind))
+            for name, label_values, extra, value in metric.samples():
+                pairs = list(zip(metric.labels, label_values)) + list(extra)
+                labels = ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+                                  for k, v in pairs)
+                lines.append("%s{%s} %s" % (name, labels, value) if labels else "%s %s" % (name, value))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+MOVEGEN_CALLS = REGISTRY.counter(
+    "backgammon_movegen_calls_total", "Legal move list requests, by whether the cached list was reused.",
+    ("result",))
+HTTP_REQUESTS = REGISTRY.counter(
+    "backgammon_http_requests_total", "API requests by endpoint and status code.", ("endpoint", "status"))
+HTTP_LATENCY = REGISTRY.histogram(
+    "backgammon_http_request_duration_seconds", "API request latency by endpoint.", ("endpoint",))
+AI_DECISION = REGISTRY.histogram(
+    "backgammon_ai_decision_seconds", "Time the AI took to choose a play, by player.", ("player",))
+AI_NODES = REGISTRY.counter(
+    "backgammon_ai_nodes_total", "Work done by the AI: search nodes, rollouts or evaluated plays.", ("player",))
+
+
+def record_decision(player, seconds, nodes):
+    """Records one AI decision: its time and how many nodes (or rollouts, or plays) it looked at."""
+    AI_DECISION.observe(seconds, player)
+    AI_NODES.inc(nodes, player)
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line, with any extra= fields as keys."""
+
+    _standard = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+    def format(self, record):
+        data = {
+            "time": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in self._standard:
+                data[key] = value
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+def configure_logging(level="WARNING"):
+    """Sends all log records at level or above to stderr as JSON lines."""
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter())
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+
+
+class SamplingProfiler:
+    """
+    Samples the call stack of one thread every interval seconds from a background thread and
+    counts the stacks, so the profiled code runs at full speed between samples.
+    """
+
+    def __init__(self, thread_id=None, interval=0.001):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks = StackCounter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append("%s:%s" % (os.path.basename(code.co_filename), code.co_name))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def write(self, path):
+        """Writes the samples in collapsed-stack format (one "frame;frame;... count" per line)."""
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write("%s %d\n" % (stack, count))
+
+
+def profile_path(directory, name):
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, "%s-%d.txt" % (name, time.time_ns()))
@@ -0,0 +1,46 @@
+# parity tests for the batched engine: its legal moves and the effect of playing them must match
+# the single-game engine in every position random play reaches.
+# run with: python -m pytest test_batch_engine.py
+import numpy as np
+
+from batch_engine import BatchBackgammon, cross_check, random_policy
+
+
+def test_move_sets_match_get_all_available_moves():
+    for seed in range(3):
+        assert cross_check(n=32, seed=seed) > 1000
+
+
+def test_apply_matches_position_apply():
+    engine = BatchBackgammon(32, seed=7)
+    compared = 0
+    expected = []  # (game, Position after the same move) for the games of the last step
+
+    def checking_policy(engine, idx, bits):
+        slots, dice = random_policy(engine, idx, bits)
+        for i, slot, die in zip(idx, slots, dice):
+            pos = engine.position(i)
+            remaining = [int(d) for d in engine.remaining[i] if d]
+            start = slot - 1 if pos.turn == 1 else 24 - slot
+            move = next(m for m in pos.moves(remaining) if m[0] == start and m[2] == die)
+            pos.apply(move)
+            expected.append((i, pos))
+        return slots, dice
+
+    for _ in range(3000):
+        expected.clear()
+        if not len(engine.step(checking_policy)):
+            break
+        for i, pos in expected:
+            assert [int(x) for x in engine.points[i]] == pos.points
+            assert (int(engine.off[i, 0]), int(engine.off[i, 1])) == (pos.off_white, pos.off_black)
+            assert int(engine.winner[i]) == (pos.winner() or 0)
+            compared += 1
+    assert (engine.winner != 0).all()
+    assert compared > 1000
+
+
+def test_run_plays_every_game_to_a_winner():
+    winners = BatchBackgammon(16, seed=1).run(40)
+    assert len(winners) == 40
+    assert np.isin(winners, (1, -1)).all()
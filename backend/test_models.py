@@ -0,0 +1,64 @@
+# tests for the game store: a game loaded from its snapshots and events must match the live game
+# it was recorded from, move by move, down to the state of its dice.
+# run with: python -m pytest test_models.py
+import random
+import sqlite3
+
+import config
+from dice import RandomDice
+from game import Backgammon
+from models import ROLL, TURN, GameStore, encode_state
+
+
+def play_recorded_game(store, game_id, seed, check):
+    """Plays a random game recorded under game_id, calling check(game) after the opening and every move."""
+    rng = random.Random(seed)
+    game = Backgammon(dice=RandomDice(seed))
+    store.new_game(game_id, game)
+    game.current_player = rng.choice([1, -1])
+    game.roll_dice()
+    game.pass_blocked_turns()
+    check(game)
+    while not game.game_over:
+        moves, _ = rng.choice(game.get_all_plays())
+        for start, end, _, _ in moves:
+            game.make_move(start, end)
+            check(game)
+    return game
+
+
+def blocked_passes(events):
+    # Turns passed without a move: a TURN, its ROLL and straight away the next TURN.
+    kinds = [kind for kind, _, _ in events]
+    return sum(1 for i in range(len(kinds) - 2) if kinds[i:i + 3] == [TURN, ROLL, TURN])
+
+
+def test_load_replays_snapshots_and_passed_turns(tmp_path):
+    path = str(tmp_path / "games.db")
+    store = GameStore(path, snapshot_every=config.SNAPSHOT_EVERY)
+    compared = 0
+
+    def check(game):
+        nonlocal compared
+        loaded = store.load(game_id)
+        assert encode_state(loaded) == encode_state(game)
+        assert loaded.recorder.seq == game.recorder.seq
+        # The loaded game's dice roll on from the same point.
+        assert loaded.dice_source.rng.getstate() == game.dice_source.rng.getstate()
+        compared += 1
+
+    passes = 0
+    for seed in range(20):
+        game_id = "game-%d" % seed
+        play_recorded_game(store, game_id, seed, check)
+        passes += blocked_passes(dict(store.export())[game_id])
+        if passes:
+            break
+    store.close()
+    assert passes, "no game passed a blocked turn"
+    conn = sqlite3.connect(path)
+    snapshots = conn.execute("SELECT COUNT(*) FROM snapshots").fetchone()[0]
+    conn.close()
+    # Loads after the first snapshot start from a snapshot instead of the opening.
+    assert snapshots > 1
+    assert compared > config.SNAPSHOT_EVERY
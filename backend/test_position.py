@@ -0,0 +1,145 @@
+# tests for the compact position: full-play generation against a brute-force search of every
+# move sequence, apply/undo round trips with the incremental hash, and position IDs.
+# run with: python -m pytest test_position.py
+import random
+
+from game import Backgammon
+from position import BLACK, BLACK_BAR, ROLLS, WHITE, WHITE_BAR, Position, legal_plays
+
+
+def random_position(rng):
+    """A legal position with 15 checkers a side, some on the bar or borne off, often a bear-off."""
+    points = [0] * 26
+    off = {}
+    for side in (WHITE, BLACK):
+        off[side] = rng.choice([0, 0, 0, rng.randint(0, 14)])
+        bar = min(rng.choice([0, 0, 0, 1, 2]), 15 - off[side])
+        points[WHITE_BAR if side == WHITE else BLACK_BAR] = bar * side
+        if rng.random() < 0.3:
+            slots = range(19, 25) if side == WHITE else range(1, 7)
+        else:
+            slots = range(1, 25)
+        for _ in range(15 - off[side] - bar):
+            slot = rng.choice([s for s in slots if points[s] * side >= 0] or
+                              [s for s in range(1, 25) if points[s] * side >= 0])
+            points[slot] += side
+    pos = Position(turn=rng.choice([WHITE, BLACK]), off_white=off[WHITE], off_black=off[BLACK])
+    pos.points = points
+    pos.rehash()
+    return pos
+
+
+def played_positions(rng, count):
+    """Positions reached by random full plays from the opening position."""
+    positions = []
+    while len(positions) < count:
+        pos = Backgammon().pos.copy()
+        pos.turn = rng.choice([WHITE, BLACK])
+        pos.rehash()
+        for _ in range(rng.randint(1, 60)):
+            if pos.winner():
+                break
+            dice, _ = rng.choice(ROLLS)
+            _, pos = rng.choice(legal_plays(pos, dice))
+            pos.switch_turn()
+        if not pos.winner():
+            positions.append(pos)
+    return positions
+
+
+def brute_force_plays(pos, dice):
+    """
+    Length and final position keys of the legal plays of dice in pos: every maximal sequence of
+    single moves, keeping the longest, and the larger die when only one die of two can be played.
+    """
+    finals = []  # (moves played, first die, final key)
+    seen = set()
+
+    def walk(pos, remaining, played, first):
+        state = (pos.key(), tuple(sorted(remaining)), played, first if played == 1 else None)
+        if state in seen:
+            return
+        seen.add(state)
+        moves = set(pos.moves(remaining))
+        if not moves:
+            finals.append((played, first, pos.key()))
+        for move in moves:
+            child = pos.copy()
+            child.apply(move)
+            rest = list(remaining)
+            rest.remove(move[2])
+            walk(child, rest, played + 1, first or move[2])
+
+    walk(pos, list(dice), 0, None)
+    longest = max(played for played, _, _ in finals)
+    finals = [f for f in finals if f[0] == longest]
+    if longest == 1 and len(dice) == 2 and dice[0] != dice[1]:
+        finals = [f for f in finals if f[1] == max(dice)] or finals
+    return longest, {key for _, _, key in finals}
+
+
+def test_legal_plays_match_brute_force():
+    rng = random.Random(1)
+    positions = [random_position(rng) for _ in range(40)] + played_positions(rng, 40)
+    for pos in positions:
+        before = pos.key()
+        for dice, _ in ROLLS:
+            plays = legal_plays(pos, dice)
+            assert pos.key() == before
+            longest, expected = brute_force_plays(pos, dice)
+            keys = [child.key() for _, child in plays]
+            assert len(keys) == len(set(keys)), (before, dice)
+            assert set(keys) == expected, (before, dice)
+            for moves, child in plays:
+                # Each play is a legal sequence of the maximal length that leads to its position.
+                assert len(moves) == longest
+                replay = pos.copy()
+                remaining = list(dice)
+                for move in moves:
+                    assert move in replay.moves(remaining)
+                    replay.apply(move)
+                    remaining.remove(move[2])
+                assert replay.key() == child.key()
+                assert child.zobrist == replay.zobrist
+
+
+def test_apply_and_undo_round_trip():
+    rng = random.Random(2)
+    for _ in range(2000):
+        pos = random_position(rng)
+        start_key, start_hash = pos.key(), pos.zobrist
+        dice = list(rng.choice(ROLLS)[0])
+        played = []
+        while True:
+            moves = pos.moves(dice)
+            if not moves:
+                break
+            move = rng.choice(moves)
+            pos.apply(move)
+            dice.remove(move[2])
+            played.append((move, pos.key(), pos.zobrist))
+            check = pos.copy()
+            check.rehash()
+            assert check.zobrist == pos.zobrist, move
+        for i in range(len(played) - 1, -1, -1):
+            move, key, zobrist = played[i]
+            assert (pos.key(), pos.zobrist) == (key, zobrist)
+            pos.undo(move)
+        assert pos.key() == start_key
+        assert pos.zobrist == start_hash
+
+
+def test_position_id_round_trip():
+    assert Backgammon().pos.position_id() == "4HPwATDgc/ABMA"
+    rng = random.Random(3)
+    ids = set()
+    for pos in [random_position(rng) for _ in range(2000)] + played_positions(rng, 200):
+        position_id = pos.position_id()
+        assert len(position_id) == 14
+        assert Position.from_position_id(position_id, pos.turn).key() == pos.key()
+        ids.add((position_id, pos.turn))
+        # The ID is written from the side to move, so the same board has another ID for the other side.
+        flipped = pos.copy()
+        flipped.switch_turn()
+        assert Position.from_position_id(flipped.position_id(), flipped.turn).key() == flipped.key()
+    assert len(ids) > 1000
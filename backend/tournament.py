@@ -0,0 +1,162 @@
+# headless self-play tournaments between two agents across a process pool.
+# usage: python tournament.py random random --games 1000 --workers 4 --out results.csv
+import argparse
+import csv
+import math
+import multiprocessing
+import os
+import random
+import time
+from array import array
+
+from agents import AGENTS, make_agent
+from game import Backgammon
+
+# Per-game result columns written to the results file.
+FIELDS = ("game", "seed", "a_color", "winner", "a_won", "turns", "seconds")
+
+# Agents of the current worker process, created once by _init_worker.
+_worker_agents = None
+
+
+def game_seed(base_seed, index):
+    """Seed for one game; depends only on the tournament seed and game index, not on the worker."""
+    return "%s:%d" % (base_seed, index)
+
+
+def play_game(agent_a, agent_b, index, seed, max_turns=2000):
+    """
+    Plays one game. Agent A is White in even-numbered games and Black in odd ones.
+    Returns (result row, agent A turn latencies, agent B turn latencies).
+    """
+    random.seed(seed)
+    a_color = 1 if index % 2 == 0 else -1
+    agents = {a_color: agent_a, -a_color: agent_b}
+    latencies = {a_color: array("d"), -a_color: array("d")}
+    game = Backgammon()
+    game.current_player = random.choice([1, -1])
+    game.roll_dice()
+
+    t0 = time.perf_counter()
+    turns = 0
+    while not game.game_over and turns < max_turns:
+        player = game.current_player
+        start = time.perf_counter()
+        agents[player].play_turn(game)
+        latencies[player].append(time.perf_counter() - start)
+        turns += 1
+    elapsed = time.perf_counter() - t0
+
+    winner = game.game_over or 0
+    row = (index, seed, a_color, winner, int(winner == a_color), turns, round(elapsed, 6))
+    return row, latencies[a_color], latencies[-a_color]
+
+
+def _init_worker(name_a, name_b):
+    global _worker_agents
+    _worker_agents = (make_agent(name_a), make_agent(name_b))
+
+
+def _play_chunk(task):
+    base_seed, indices = task
+    agent_a, agent_b = _worker_agents
+    return [play_game(agent_a, agent_b, i, game_seed(base_seed, i)) for i in indices]
+
+
+def wilson_interval(wins, n, z=1.96):
+    """95% Wilson score interval for a win rate."""
+    if n == 0:
+        return 0.0, 1.0
+    p = wins / n
+    denominator = 1 + z * z / n
+    centre = (p + z * z / (2 * n)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    return centre - margin, centre + margin
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted sequence (q in 0-100)."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, math.ceil(q / 100 * len(sorted_values)) - 1)
+    return sorted_values[rank]
+
+
+def run_tournament(name_a, name_b, games, workers=None, seed=0, out=None, chunk=8):
+    """
+    Plays `games` games between agents name_a and name_b on a pool of worker processes and streams
+    per-game rows to `out` (CSV) as they finish. Returns a summary dict.
+    """
+    workers = workers or os.cpu_count() or 1
+    tasks = [(seed, range(i, min(i + chunk, games))) for i in range(0, games, chunk)]
+    wins = 0
+    finished = 0
+    latencies = {"a": array("d"), "b": array("d")}
+
+    out_file = open(out, "w", newline="") if out else None
+    writer = csv.writer(out_file) if out_file else None
+    if writer:
+        writer.writerow(FIELDS)
+    t0 = time.perf_counter()
+    try:
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(name_a, name_b)) as pool:
+            for results in pool.imap_unordered(_play_chunk, tasks):
+                for row, lat_a, lat_b in results:
+                    finished += 1
+                    wins += row[4]
+                    latencies["a"].extend(lat_a)
+                    latencies["b"].extend(lat_b)
+                    if writer:
+                        writer.writerow(row)
+    finally:
+        if out_file:
+            out_file.close()
+    elapsed = time.perf_counter() - t0
+
+    low, high = wilson_interval(wins, finished)
+    summary = {
+        "agent_a": name_a,
+        "agent_b": name_b,
+        "games": finished,
+        "workers": workers,
+        "a_wins": wins,
+        "a_win_rate": wins / finished if finished else 0.0,
+        "a_win_rate_ci95": (low, high),
+        "seconds": elapsed,
+        "games_per_second": finished / elapsed if elapsed else 0.0,
+    }
+    for side in ("a", "b"):
+        values = sorted(latencies[side])
+        summary["latency_%s_ms" % side] = {
+            "p50": percentile(values, 50) * 1000,
+            "p90": percentile(values, 90) * 1000,
+            "p99": percentile(values, 99) * 1000,
+            "max": (values[-1] if values else 0.0) * 1000,
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play a headless tournament between two agents.")
+    parser.add_argument("agent_a", choices=sorted(AGENTS))
+    parser.add_argument("agent_b", choices=sorted(AGENTS))
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="CSV file for per-game results")
+    parser.add_argument("--chunk", type=int, default=8, help="games per worker task")
+    args = parser.parse_args()
+
+    s = run_tournament(args.agent_a, args.agent_b, args.games, args.workers, args.seed, args.out, args.chunk)
+    low, high = s["a_win_rate_ci95"]
+    print("%s vs %s: %d games on %d workers in %.2fs (%.1f games/s)"
+          % (s["agent_a"], s["agent_b"], s["games"], s["workers"], s["seconds"], s["games_per_second"]))
+    print("%s win rate: %.3f (95%% CI %.3f-%.3f)" % (s["agent_a"], s["a_win_rate"], low, high))
+    for side, name in (("a", s["agent_a"]), ("b", s["agent_b"])):
+        lat = s["latency_%s_ms" % side]
+        print("%s turn latency ms: p50 %.3f  p90 %.3f  p99 %.3f  max %.3f"
+              % (name, lat["p50"], lat["p90"], lat["p99"], lat["max"]))
+
+
+if __name__ == '__main__':
+    main()
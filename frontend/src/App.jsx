@@ -2,6 +2,12 @@ import { useState, useEffect } from "react";
 import { startGame, rollDice, makeMove, getValidMoves, aiMove } from "./api";
 import "./App.css";
 
+// The bear-off move [start, end, ...] for the checker on start, or undefined. States pushed over
+// the websocket carry bear_offs; states from the REST API carry the full all_moves list.
+const findBearOff = (state, start) => state.bear_offs
+  ? state.bear_offs.find(m => m[0] === start)
+  : state.all_moves.find(m => m[0] === start && m[3] === "bear_off");
+
 function App() {
   const [gameState, setGameState] = useState(null);
   const [dice, setDice] = useState([0, 0]);
@@ -208,9 +214,7 @@ function App() {
               </div>
 
               {gameState && gameState.all_in_home && selectedChecker !== null && gameState.current_player === 1 && (() => {
-                const bearOffMove = gameState.all_moves.find(
-                  m => m[0] === selectedChecker && m[3] === "bear_off"
-                );
+                const bearOffMove = findBearOff(gameState, selectedChecker);
                 return bearOffMove ? (
                   <div className="borne-off-selector" onClick={() => handleMove(selectedChecker, bearOffMove[1])}>
                     Bear Off Selected White Checker
@@ -219,9 +223,7 @@ function App() {
               })()}
 
               {gameState && gameState.all_in_home && selectedChecker !== null && gameState.current_player === -1 && (() => {
-                const bearOffMove = gameState.all_moves.find(
-                  m => m[0] === selectedChecker && m[3] === "bear_off"
-                );
+                const bearOffMove = findBearOff(gameState, selectedChecker);
                 return bearOffMove ? (
                   <div className="borne-off-selector" onClick={() => handleMove(selectedChecker, bearOffMove[1])}>
                     Bear Off Selected Black Checker
@@ -2,10 +2,14 @@ import axios from "axios";
 
 const API_URL = "http://127.0.0.1:5000/api/game";
 
+// Id of the current game, returned by /start and sent with every other request
+let gameId = null;
+
 // Start a new game
 export const startGame = async () => {
     try {
-        const response = await axios.post(`${API_URL}/start`);
+        const response = await axios.post(`${API_URL}/start`, { game_id: gameId });
+        gameId = response.data.game_id;
         return response.data;
     } catch (error) {
         console.error("API Error:", error);
@@ -16,7 +20,7 @@ export const startGame = async () => {
 // Roll dice
 export const rollDice = async () => {
     try {
-        const response = await axios.get(`${API_URL}/roll-dice`);
+        const response = await axios.get(`${API_URL}/roll-dice`, { params: { game_id: gameId } });
         return response.data;
     } catch (error) {
         console.error("API Error:", error);
@@ -27,7 +31,7 @@ export const rollDice = async () => {
 // Make a move
 export const makeMove = async (start, end) => {
     try {
-        const response = await axios.post(`${API_URL}/move`, { start, end });
+        const response = await axios.post(`${API_URL}/move`, { start, end, game_id: gameId });
         return response.data;
     } catch (error) {
         console.error("API Error:", error);
@@ -38,7 +42,7 @@ export const makeMove = async (start, end) => {
 // Get game state
 export const getGameState = async () => {
     try {
-        const response = await axios.get(`${API_URL}/state`);
+        const response = await axios.get(`${API_URL}/state`, { params: { game_id: gameId } });
         return response.data;
     } catch (error) {
         console.error("API Error:", error);
@@ -50,7 +54,7 @@ export const getGameState = async () => {
 export const getValidMoves = async (payload) => {
     try {
       // Remove the extra /api/game portion.
-      const response = await axios.post(`${API_URL}/valid-moves`, payload);
+      const response = await axios.post(`${API_URL}/valid-moves`, { ...payload, game_id: gameId });
       return response.data;
     } catch (error) {
       console.error("API Error:", error);
@@ -60,7 +64,7 @@ export const getValidMoves = async (payload) => {
 
 export const aiMove = async () => {
     try {
-      const response = await axios.post(`${API_URL}/ai-move`);
+      const response = await axios.post(`${API_URL}/ai-move`, { game_id: gameId });
       return response.data;
     } catch (error) {
       console.error("API Error:", error);
@@ -0,0 +1,48 @@
+import { io } from "socket.io-client";
+
+const SOCKET_URL = "http://127.0.0.1:5000";
+
+// Applies a "delta" message from the server to a game state and returns the new state
+const applyDelta = (state, delta) => {
+    const next = { ...state, seq: delta.seq };
+    if (delta.points) {
+        next.board = [...state.board];
+        delta.points.forEach(([index, count]) => { next.board[index] = count; });
+    }
+    if (delta.bar) [next.bar_white, next.bar_black] = delta.bar;
+    if (delta.off) [next.borne_off_white, next.borne_off_black] = delta.off;
+    ["dice", "moves_remaining", "current_player", "game_over", "all_in_home", "bear_offs"].forEach(key => {
+        if (key in delta) next[key] = delta[key];
+    });
+    return next;
+};
+
+// Follows a game over the websocket: onState gets the full state on join and after every change.
+// Deltas do not update all_moves; bear_offs holds the bear-off moves instead.
+// Returns a function that stops following.
+export const subscribeToGame = (gameId, onState) => {
+    const socket = io(SOCKET_URL);
+    let state = null;
+
+    socket.on("connect", () => socket.emit("join", { game_id: gameId }));
+    socket.on("state", data => {
+        state = data;
+        onState(state);
+    });
+    socket.on("delta", delta => {
+        if (!state || delta.seq <= state.seq) return;
+        if (delta.seq !== state.seq + 1) {
+            // Missed an update: ask for the whole state again.
+            socket.emit("resync", { game_id: gameId });
+            return;
+        }
+        state = applyDelta(state, delta);
+        onState(state);
+    });
+    socket.on("error", data => console.error("Socket Error:", data.error));
+
+    return () => {
+        socket.emit("leave", { game_id: gameId });
+        socket.disconnect();
+    };
+};